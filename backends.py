@@ -0,0 +1,589 @@
+#!/usr/bin/env python3
+"""
+Бэкенды инференса для SpaceRestoration: Ollama, OpenAI-совместимый сервер (vLLM)
+и llama.cpp в том же процессе
+"""
+import json
+import logging
+import os
+import re
+import threading
+import time
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+logger = logging.getLogger('space_restoration')
+
+DEFAULT_OLLAMA_MODEL = "hf.co/Vikhrmodels/QVikhr-3-1.7B-Instruction-noreasoning-GGUF:Q4_K_M"
+# GGUF-файл, который кладёт download_model.py
+DEFAULT_GGUF_PATH = "/app/models/QVikhr-3-1.7B-Instruction-noreasoning.Q4_K_M.gguf"
+
+# Поля статистики из ответа Ollama /api/generate
+OLLAMA_STAT_FIELDS = (
+    'total_duration', 'load_duration', 'prompt_eval_count',
+    'prompt_eval_duration', 'eval_count', 'eval_duration',
+)
+
+
+# Полный список позиций: [1, 2, 3] или []
+POSITION_LIST_PATTERN = re.compile(r'\[\s*(?:\d+\s*(?:,\s*\d+\s*)*)?\]')
+THINK_PATTERN = re.compile(r'<think>.*?</think>', flags=re.DOTALL)
+
+
+class BackendError(Exception):
+    """Ошибка обращения к серверу инференса"""
+
+
+def parse_keep_alive(value: str):
+    """keep_alive для Ollama: число - секунды (-1 - держать всегда), иначе строка вида 30m"""
+    try:
+        return int(value)
+    except ValueError:
+        return value
+
+
+@dataclass
+class Generation:
+    """Результат генерации: текст ответа и статистика сервера"""
+    text: str
+    stats: Dict[str, float] = field(default_factory=dict)
+
+
+class PositionListDetector:
+    """
+    Инкрементально разбирает поток токенов и сообщает, когда в ответе
+    закрылось нужное число списков позиций (рассуждения в <think> не учитываются)
+    """
+
+    def __init__(self, expected_lists: int = 1):
+        self.expected_lists = expected_lists
+        self.parts = []
+
+    def feed(self, chunk: str) -> bool:
+        """Добавляет фрагмент ответа; True - ответ уже полный"""
+        self.parts.append(chunk)
+        if ']' not in chunk:
+            return False
+        text = ''.join(self.parts)
+        if '<think>' in text:
+            if '</think>' not in text:
+                return False
+            text = THINK_PATTERN.sub('', text)
+        return len(POSITION_LIST_PATTERN.findall(text)) >= self.expected_lists
+
+    @property
+    def text(self) -> str:
+        return ''.join(self.parts)
+
+
+class InferenceBackend:
+    """Базовый класс бэкенда: генерация по одному промпту и пакетом"""
+
+    name = "base"
+
+    def __init__(self, base_url: str, model_name: Optional[str] = None, timeout: float = 60):
+        self.base_url = base_url.rstrip('/')
+        self.model_name = model_name
+        self.timeout = timeout
+
+    def generate(self, prompt: str, options: Dict, expected_lists: int = 1) -> Generation:
+        """
+        Генерирует ответ на один промпт. expected_lists - сколько списков позиций
+        ожидается в ответе: потоковые бэкенды прекращают генерацию, получив их
+        """
+        return self.generate_batch([prompt], options, [expected_lists])[0]
+
+    def generate_batch(self, prompts: List[str], options: Dict,
+                       expected_lists: Optional[List[int]] = None) -> List[Generation]:
+        """
+        Генерирует ответы на список промптов, порядок ответов совпадает с порядком промптов.
+        expected_lists - сколько списков позиций ждать в ответе на каждый промпт (None - по одному)
+        """
+        raise NotImplementedError
+
+    def health_check(self) -> bool:
+        """Проверяет доступность сервера"""
+        raise NotImplementedError
+
+    def warm_up(self, prompt: str, options: Dict) -> Generation:
+        """
+        Загружает модель и обрабатывает общий префикс промпта одним коротким запросом,
+        чтобы сервер закэшировал его до начала основной работы
+        """
+        try:
+            return self.generate(prompt, dict(options, num_predict=1))
+        except (requests.RequestException, ValueError) as error:
+            raise BackendError(str(error)) from error
+
+
+class OllamaBackend(InferenceBackend):
+    """Бэкенд Ollama (/api/generate)"""
+
+    name = "ollama"
+
+    def __init__(self, base_url: str = "http://localhost:11434",
+                 model_name: Optional[str] = None, timeout: float = 60,
+                 max_parallel: int = 4, stream: bool = False, keep_alive=None,
+                 early_stop: bool = True):
+        super().__init__(base_url, model_name or DEFAULT_OLLAMA_MODEL, timeout)
+        # Предел одновременных HTTP-запросов к серверу - общий для всех потоков,
+        # которые пользуются бэкендом, а не для одного вызова generate_batch
+        self.max_parallel = max(1, max_parallel)
+        self._slots = threading.BoundedSemaphore(self.max_parallel)
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        # Сколько модель остаётся в памяти после запроса (None - по умолчанию сервера, 5 минут)
+        self.keep_alive = keep_alive
+        # Потоковый режим: читаем ответ по токенам и рвём соединение, как только список закрылся
+        self.stream = stream
+        # early_stop=False - поток дочитывается до конца: prompt_eval_count и prompt_eval_duration
+        # Ollama присылает только в последнем чанке, и при обрыве они теряются
+        self.early_stop = early_stop
+
+    def build_payload(self, prompt: str, options: Dict, stream: bool) -> Dict:
+        """
+        Собирает тело запроса; JSON-схема из options['format'] уходит в поле format,
+        общий префикс промпта из options['system'] - в поле system
+        """
+        options = dict(options)
+        payload = {
+            "model": self.model_name,
+            "prompt": prompt,
+            "stream": stream,
+        }
+        for key in ('format', 'system'):
+            if key in options:
+                payload[key] = options.pop(key)
+        if self.keep_alive is not None:
+            payload["keep_alive"] = self.keep_alive
+        payload["options"] = options
+        return payload
+
+    def generate(self, prompt: str, options: Dict, expected_lists: int = 1) -> Generation:
+        with self._slots:
+            if self.stream:
+                return self.generate_stream(prompt, options, expected_lists)
+            return self.generate_once(prompt, options)
+
+    def generate_once(self, prompt: str, options: Dict) -> Generation:
+        """Непотоковая генерация: ответ приходит одним JSON"""
+        payload = self.build_payload(prompt, options, stream=False)
+
+        start = time.perf_counter()
+        response = requests.post(
+            f"{self.base_url}/api/generate",
+            json=payload,
+            timeout=self.timeout
+        )
+        if response.status_code != 200:
+            raise BackendError(f"Ollama API error: {response.status_code}, {response.text}")
+
+        result = response.json()
+        stats = {key: result[key] for key in OLLAMA_STAT_FIELDS if key in result}
+        stats['http_latency'] = time.perf_counter() - start
+        return Generation(result['response'], stats)
+
+    def generate_stream(self, prompt: str, options: Dict, expected_lists: int = 1) -> Generation:
+        """
+        Потоковая генерация: читает NDJSON по мере поступления токенов и закрывает
+        соединение, как только в ответе закрылись expected_lists списков позиций
+        (при early_stop=False - после последнего чанка)
+        """
+        payload = self.build_payload(prompt, options, stream=True)
+
+        start = time.perf_counter()
+        response = requests.post(
+            f"{self.base_url}/api/generate",
+            json=payload,
+            timeout=self.timeout,
+            stream=True
+        )
+        if response.status_code != 200:
+            raise BackendError(f"Ollama API error: {response.status_code}, {response.text}")
+
+        detector = PositionListDetector(expected_lists)
+        stats = {}
+        generated = 0
+        early_stop = False
+        try:
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                chunk = json.loads(line)
+                if chunk.get('response'):
+                    if generated == 0:
+                        stats['time_to_first_token'] = time.perf_counter() - start
+                    generated += 1
+                    if detector.feed(chunk['response']) and self.early_stop and not chunk.get('done'):
+                        early_stop = True
+                        break
+                if chunk.get('done'):
+                    stats.update({key: chunk[key] for key in OLLAMA_STAT_FIELDS if key in chunk})
+                    break
+        finally:
+            # Закрытие соединения останавливает генерацию на стороне Ollama
+            response.close()
+
+        stats['http_latency'] = time.perf_counter() - start
+        stats.setdefault('eval_count', generated)
+        if early_stop:
+            stats['tokens_saved'] = max(0, options.get('num_predict', generated) - generated)
+        return Generation(detector.text, stats)
+
+    def generate_batch(self, prompts: List[str], options: Dict,
+                       expected_lists: Optional[List[int]] = None) -> List[Generation]:
+        # У Ollama нет пакетного эндпоинта: отправляем запросы параллельно,
+        # сервер сам объединяет их при OLLAMA_NUM_PARALLEL > 1
+        expected_lists = expected_lists or [1] * len(prompts)
+        if len(prompts) == 1:
+            return [self.generate(prompts[0], options, expected_lists[0])]
+        return list(self.executor().map(
+            lambda prompt, lists: self.generate(prompt, options, lists), prompts, expected_lists
+        ))
+
+    def executor(self) -> ThreadPoolExecutor:
+        """Один пул потоков на бэкенд, создаётся при первом пакетном запросе"""
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_parallel)
+            return self._executor
+
+    def health_check(self) -> bool:
+        try:
+            return requests.get(f"{self.base_url}/api/tags", timeout=10).status_code == 200
+        except requests.RequestException:
+            return False
+
+
+class OpenAICompatibleBackend(InferenceBackend):
+    """
+    Бэкенд OpenAI-совместимого сервера (vLLM, /v1/completions).
+    Все промпты пакета уходят одним запросом списком в поле prompt,
+    что позволяет серверу использовать continuous batching.
+    """
+
+    name = "openai"
+
+    def __init__(self, base_url: str = "http://localhost:8000",
+                 model_name: Optional[str] = None, timeout: float = 60):
+        super().__init__(base_url, model_name, timeout)
+
+    def resolve_model_name(self) -> str:
+        """Возвращает имя модели; если не задано, берёт первую модель из /v1/models"""
+        if self.model_name is None:
+            response = requests.get(f"{self.base_url}/v1/models", timeout=10)
+            if response.status_code != 200:
+                raise BackendError(f"OpenAI API error: {response.status_code}, {response.text}")
+            self.model_name = response.json()['data'][0]['id']
+        return self.model_name
+
+    def build_payload(self, prompts: List[str], options: Dict) -> Dict:
+        """
+        Переводит опции в формате Ollama в параметры /v1/completions.
+        JSON-схема из options['format'] передаётся как guided_json. У /v1/completions
+        нет системного сообщения, поэтому options['system'] ставится в начало каждого
+        промпта: одинаковый префикс vLLM берёт из кэша (--enable-prefix-caching)
+        """
+        system = options.get("system", "")
+        payload = {
+            "model": self.resolve_model_name(),
+            "prompt": [system + prompt for prompt in prompts],
+            "temperature": options.get("temperature", 0.0),
+            "top_p": options.get("top_p", 1.0),
+            "max_tokens": options.get("num_predict", 200),
+        }
+        # Расширения vLLM
+        if "repeat_penalty" in options:
+            payload["repetition_penalty"] = options["repeat_penalty"]
+        if "format" in options:
+            payload["guided_json"] = options["format"]
+        return payload
+
+    def generate_batch(self, prompts: List[str], options: Dict,
+                       expected_lists: Optional[List[int]] = None) -> List[Generation]:
+        payload = self.build_payload(prompts, options)
+        start = time.perf_counter()
+        response = requests.post(
+            f"{self.base_url}/v1/completions",
+            json=payload,
+            timeout=self.timeout
+        )
+        if response.status_code != 200:
+            raise BackendError(f"OpenAI API error: {response.status_code}, {response.text}")
+
+        result = response.json()
+        choices = sorted(result['choices'], key=lambda choice: choice['index'])
+        if len(choices) != len(prompts):
+            raise BackendError(f"Ожидалось {len(prompts)} ответов, получено {len(choices)}")
+
+        usage = result.get('usage') or {}
+        stats = {'http_latency': time.perf_counter() - start}
+        if usage:
+            # usage приходит на весь пакет, распределяем поровну
+            stats['prompt_eval_count'] = usage.get('prompt_tokens', 0) / len(prompts)
+            stats['eval_count'] = usage.get('completion_tokens', 0) / len(prompts)
+            cached = (usage.get('prompt_tokens_details') or {}).get('cached_tokens')
+            if cached is not None:
+                stats['prompt_cached_tokens'] = cached / len(prompts)
+        return [Generation(choice['text'], dict(stats)) for choice in choices]
+
+    def health_check(self) -> bool:
+        try:
+            return requests.get(f"{self.base_url}/health", timeout=10).status_code == 200
+        except requests.RequestException:
+            return False
+
+
+class LlamaCppBackend(InferenceBackend):
+    """
+    Инференс в том же процессе через llama-cpp-python, без HTTP и отдельного сервера.
+    base_url - путь к GGUF-файлу; файл отображается в память (mmap), поэтому загрузка
+    быстрая, а страницы весов делятся между процессами. Как и Ollama, промпт оборачивается
+    в шаблон чата из GGUF, поэтому ответы можно сравнивать с HTTP-бэкендом
+    """
+
+    name = "llamacpp"
+
+    def __init__(self, base_url: str = DEFAULT_GGUF_PATH, model_name: Optional[str] = None,
+                 timeout: float = 60, n_threads: Optional[int] = None, n_ctx: int = 4096,
+                 n_batch: int = 512, use_mmap: bool = True, stream: bool = False):
+        # llama-cpp-python нужен только этому бэкенду, поэтому импортируем по требованию
+        try:
+            from llama_cpp import Llama
+        except ImportError as error:
+            raise BackendError("Для бэкенда llamacpp нужен пакет llama-cpp-python: "
+                               "pip install llama-cpp-python") from error
+        super().__init__(base_url, model_name or os.path.basename(base_url), timeout)
+        self.model_path = base_url
+        # Как у Ollama: при stream генерация прекращается, как только список позиций закрылся
+        self.stream = stream
+        start = time.perf_counter()
+        self.llm = Llama(model_path=self.model_path, n_threads=n_threads, n_ctx=n_ctx,
+                         n_batch=n_batch, use_mmap=use_mmap, verbose=False)
+        self.load_duration = time.perf_counter() - start
+        # Контекст llama.cpp не потокобезопасен: промпты обрабатываются по очереди
+        self._lock = threading.Lock()
+
+    def build_request(self, prompt: str, options: Dict) -> Dict:
+        """Переводит опции в формате Ollama в параметры create_chat_completion"""
+        messages = [{"role": "user", "content": prompt}]
+        if "system" in options:
+            # Префикс промпта одинаков во всех запросах, и llama.cpp
+            # не пересчитывает совпавшее с прошлым запросом начало контекста
+            messages.insert(0, {"role": "system", "content": options["system"]})
+        request = {
+            "messages": messages,
+            "temperature": options.get("temperature", 0.0),
+            "top_p": options.get("top_p", 1.0),
+            "max_tokens": options.get("num_predict", 200),
+            "repeat_penalty": options.get("repeat_penalty", 1.0),
+        }
+        if "format" in options:
+            request["response_format"] = {"type": "json_object", "schema": options["format"]}
+        return request
+
+    def generate(self, prompt: str, options: Dict, expected_lists: int = 1) -> Generation:
+        request = self.build_request(prompt, options)
+        start = time.perf_counter()
+        with self._lock:
+            if not self.stream:
+                result = self.llm.create_chat_completion(**request)
+                usage = result.get('usage') or {}
+                stats = {
+                    'prompt_eval_count': usage.get('prompt_tokens', 0),
+                    'eval_count': usage.get('completion_tokens', 0),
+                    'http_latency': time.perf_counter() - start,
+                }
+                return Generation(result['choices'][0]['message'].get('content') or '', stats)
+
+            detector = PositionListDetector(expected_lists)
+            stats = {}
+            generated = 0
+            early_stop = False
+            for chunk in self.llm.create_chat_completion(stream=True, **request):
+                content = chunk['choices'][0]['delta'].get('content')
+                if not content:
+                    continue
+                if generated == 0:
+                    stats['time_to_first_token'] = time.perf_counter() - start
+                generated += 1
+                if detector.feed(content):
+                    early_stop = chunk['choices'][0].get('finish_reason') is None
+                    break
+
+        stats['http_latency'] = time.perf_counter() - start
+        stats['eval_count'] = generated
+        if early_stop:
+            stats['tokens_saved'] = max(0, request['max_tokens'] - generated)
+        return Generation(detector.text, stats)
+
+    def generate_batch(self, prompts: List[str], options: Dict,
+                       expected_lists: Optional[List[int]] = None) -> List[Generation]:
+        expected_lists = expected_lists or [1] * len(prompts)
+        return [self.generate(prompt, options, lists)
+                for prompt, lists in zip(prompts, expected_lists)]
+
+    def health_check(self) -> bool:
+        return self.llm is not None
+
+
+class EndpointPool(InferenceBackend):
+    """
+    Пул однотипных серверов инференса. Каждый вызов уходит на исправный сервер
+    с наименьшим числом промптов в работе; при ошибке сервер помечается неисправным,
+    а запрос повторяется на другом. Фоновая проверка здоровья возвращает серверы в пул
+    """
+
+    def __init__(self, backends: List[InferenceBackend], health_interval: float = 5.0):
+        if not backends:
+            raise ValueError("Пул серверов пуст")
+        first = backends[0]
+        super().__init__(first.base_url, first.model_name, first.timeout)
+        self.name = first.name
+        self.backends = backends
+        self.health_interval = health_interval
+        self.healthy = [True] * len(backends)
+        self.outstanding = [0] * len(backends)
+        self.requests = [0] * len(backends)
+        self.failures = [0] * len(backends)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def acquire(self, tried: set, size: int) -> Optional[int]:
+        """Выбирает сервер для запроса из size промптов; None - все серверы уже пробовали"""
+        with self._lock:
+            candidates = [i for i in range(len(self.backends)) if i not in tried]
+            if not candidates:
+                return None
+            # Если исправных не осталось, пробуем и помеченные неисправными
+            candidates = [i for i in candidates if self.healthy[i]] or candidates
+            index = min(candidates, key=lambda i: self.outstanding[i])
+            self.outstanding[index] += size
+            self.requests[index] += 1
+            return index
+
+    def release(self, index: int, size: int, error: Optional[Exception] = None):
+        with self._lock:
+            self.outstanding[index] -= size
+            if error is not None:
+                self.healthy[index] = False
+                self.failures[index] += 1
+
+    def generate_batch(self, prompts: List[str], options: Dict,
+                       expected_lists: Optional[List[int]] = None) -> List[Generation]:
+        tried = set()
+        errors = []
+        while True:
+            index = self.acquire(tried, len(prompts))
+            if index is None:
+                raise BackendError(f"Все серверы пула вернули ошибку: {'; '.join(errors)}")
+            backend = self.backends[index]
+            try:
+                generations = backend.generate_batch(prompts, options, expected_lists)
+            except (BackendError, requests.RequestException, ValueError) as error:
+                self.release(index, len(prompts), error)
+                tried.add(index)
+                errors.append(f"{backend.base_url}: {error}")
+                logger.warning("Сервер %s недоступен, запрос уходит на другой: %s",
+                               backend.base_url, error)
+                continue
+            self.release(index, len(prompts))
+            for generation in generations:
+                generation.stats['endpoint'] = backend.base_url
+            if tried:
+                generations[0].stats['failovers'] = len(tried)
+            return generations
+
+    def check_health(self) -> List[bool]:
+        """Проверяет все серверы параллельно и обновляет их состояние"""
+        with ThreadPoolExecutor(max_workers=len(self.backends)) as executor:
+            states = list(executor.map(lambda backend: backend.health_check(), self.backends))
+        with self._lock:
+            for index, state in enumerate(states):
+                if state != self.healthy[index]:
+                    logger.info("Сервер %s %s", self.backends[index].base_url,
+                                "снова доступен" if state else "не прошёл проверку здоровья")
+            self.healthy = states
+        return states
+
+    def health_check(self) -> bool:
+        """Пул доступен, если исправен хотя бы один сервер"""
+        return any(self.check_health())
+
+    def warm_up(self, prompt: str, options: Dict) -> Generation:
+        """
+        Прогревает все исправные серверы пула параллельно. Сервер, на котором прогрев
+        не удался, помечается неисправным; ошибка - только если не прогрелся ни один
+        """
+        indexes = [i for i, healthy in enumerate(self.healthy) if healthy]
+
+        def warm(index):
+            try:
+                return self.backends[index].warm_up(prompt, options), None
+            except BackendError as error:
+                return None, error
+
+        with ThreadPoolExecutor(max_workers=len(indexes) or 1) as executor:
+            results = list(executor.map(warm, indexes))
+        errors = []
+        with self._lock:
+            for index, (_, error) in zip(indexes, results):
+                if error is not None:
+                    self.healthy[index] = False
+                    self.failures[index] += 1
+                    errors.append(f"{self.backends[index].base_url}: {error}")
+                    logger.warning("Прогрев сервера %s не удался: %s",
+                                   self.backends[index].base_url, error)
+        generations = [generation for generation, error in results if error is None]
+        if not generations:
+            raise BackendError(f"Не прогрелся ни один сервер пула: {'; '.join(errors)}"
+                               if errors else "Нет исправных серверов для прогрева")
+        return generations[0]
+
+    def start_health_checks(self) -> 'EndpointPool':
+        """Запускает фоновую проверку здоровья раз в health_interval секунд"""
+        def loop():
+            while not self._stop.wait(self.health_interval):
+                self.check_health()
+
+        self._thread = threading.Thread(target=loop, daemon=True)
+        self._thread.start()
+        return self
+
+    def stats(self) -> List[Dict]:
+        with self._lock:
+            return [{'url': backend.base_url, 'healthy': self.healthy[i],
+                     'requests': self.requests[i], 'failures': self.failures[i]}
+                    for i, backend in enumerate(self.backends)]
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+BACKENDS = {
+    OllamaBackend.name: OllamaBackend,
+    OpenAICompatibleBackend.name: OpenAICompatibleBackend,
+    LlamaCppBackend.name: LlamaCppBackend,
+}
+
+
+def create_backend(kind: str, base_url: str, model_name: Optional[str] = None,
+                   timeout: float = 60, **kwargs) -> InferenceBackend:
+    """
+    Создаёт бэкенд по имени: 'ollama', 'openai' или 'llamacpp' (base_url - путь к GGUF);
+    kwargs передаются конструктору.
+    Несколько адресов через запятую дают пул серверов EndpointPool
+    """
+    if kind not in BACKENDS:
+        raise ValueError(f"Неизвестный бэкенд: {kind}. Доступны: {', '.join(BACKENDS)}")
+    urls = [url.strip() for url in base_url.split(',') if url.strip()]
+    if len(urls) > 1:
+        return EndpointPool([BACKENDS[kind](url, model_name=model_name, timeout=timeout, **kwargs)
+                             for url in urls])
+    return BACKENDS[kind](base_url, model_name=model_name, timeout=timeout, **kwargs)
@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк пропускной способности и задержек SpaceRestoration.
+По умолчанию поднимает локальный сервер-заглушку (mock_server.py), поэтому не требует GPU.
+Результаты пишутся в JSON, чтобы сравнивать производительность между коммитами
+"""
+import argparse
+import contextlib
+import json
+import math
+import os
+import subprocess
+import tempfile
+import threading
+import time
+from itertools import islice
+from typing import Dict, List
+
+from backends import create_backend
+from dataset_io import DatasetReader
+from mock_server import MockInferenceServer
+import space_restoration_solution
+from space_restoration_solution import SpaceRestoration, restore_spaces_concurrently
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Перцентиль методом ближайшего ранга"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(q / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def git_commit() -> str:
+    """Текущий коммит, чтобы результаты можно было сопоставить с кодом"""
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        return ''
+
+
+class TimedModel:
+    """Обёртка над SpaceRestoration, замеряющая задержку каждого вызова"""
+
+    def __init__(self, model: SpaceRestoration):
+        self.model = model
+        self.latencies = []
+        self._lock = threading.Lock()
+
+    def restore_spaces_batch(self, texts: List[str]) -> List[List[int]]:
+        start = time.perf_counter()
+        result = self.model.restore_spaces_batch(texts)
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            # Каждая строка пакета ждала весь пакет
+            self.latencies.extend([elapsed] * len(texts))
+        return result
+
+
+def run_model_benchmark(args, url: str, rows, concurrency: int, prefix_reuse: bool = True) -> Dict:
+    """
+    Прогоняет строки через SpaceRestoration с заданным числом одновременных запросов.
+    prefix_reuse=False - общий префикс промпта не переиспользуется сервером
+    """
+    backend_options = {}
+    if args.backend == 'ollama':
+        backend_options = {'stream': args.stream, 'max_parallel': concurrency}
+        if args.compare_prefix_reuse:
+            # При раннем обрыве потока Ollama не успевает прислать статистику префилла
+            backend_options['early_stop'] = False
+    backend = create_backend(args.backend, url, model_name=args.model_name, **backend_options)
+    model = SpaceRestoration(url, backend=backend, pack_size=args.pack_size,
+                             token_budget=args.token_budget, json_schema=args.json_schema,
+                             prefix_reuse=prefix_reuse)
+    timed = TimedModel(model)
+    batch_size = max(args.batch_size, args.pack_size)
+
+    start = time.perf_counter()
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        processed = sum(1 for _ in restore_spaces_concurrently(timed, rows, concurrency, batch_size))
+    elapsed = time.perf_counter() - start
+
+    stats = model.token_stats
+    items = max(1, stats['items'])
+    requests = max(1, stats['requests'])
+    return {
+        'mode': 'model' if prefix_reuse else 'model_no_reuse',
+        'concurrency': concurrency,
+        'rows': processed,
+        'seconds': round(elapsed, 4),
+        'rows_per_sec': round(processed / elapsed, 2) if elapsed else 0.0,
+        'latency_p50': round(percentile(timed.latencies, 50), 4),
+        'latency_p95': round(percentile(timed.latencies, 95), 4),
+        'latency_p99': round(percentile(timed.latencies, 99), 4),
+        'requests': stats['requests'],
+        'prompt_tokens': stats['prompt_tokens'],
+        'generated_tokens': stats['completion_tokens'],
+        'prompt_tokens_per_item': round(stats['prompt_tokens'] / items, 2),
+        'generated_tokens_per_item': round(stats['completion_tokens'] / items, 2),
+        'tokens_saved': stats['tokens_saved'],
+        'prompt_eval_count_per_request': round(stats['prompt_tokens'] / requests, 2),
+        'prompt_eval_ms_per_request': round(stats['prompt_eval_duration'] / 1e6 / requests, 3),
+        'cached_prompt_tokens_per_request': round(stats['prompt_cached_tokens'] / requests, 2),
+    }
+
+
+def print_prefix_reuse(runs: List[Dict]):
+    """Сравнивает префилл с переиспользованием префикса и без него"""
+    without = {run['concurrency']: run for run in runs if run['mode'] == 'model_no_reuse'}
+    print("\nПереиспользование префикса промпта (без -> с):")
+    for run in runs:
+        old = without.get(run['concurrency'])
+        if run['mode'] != 'model' or old is None:
+            continue
+        change = (run['rows_per_sec'] / old['rows_per_sec'] - 1) * 100 if old['rows_per_sec'] else 0.0
+        print(f"  x{run['concurrency']:<3} prompt_eval_count/запрос "
+              f"{old['prompt_eval_count_per_request']:.1f} -> {run['prompt_eval_count_per_request']:.1f}, "
+              f"prompt_eval_duration/запрос {old['prompt_eval_ms_per_request']:.1f} -> "
+              f"{run['prompt_eval_ms_per_request']:.1f} мс, "
+              f"из кэша {old['cached_prompt_tokens_per_request']:.1f} -> "
+              f"{run['cached_prompt_tokens_per_request']:.1f} ток., "
+              f"rows/sec {old['rows_per_sec']:.2f} -> {run['rows_per_sec']:.2f} ({change:+.1f}%)")
+
+
+def run_main_benchmark(args, url: str, concurrency: int) -> Dict:
+    """Прогоняет весь конвейер main() (чтение, журнал, сборка CSV) на датасете"""
+    with tempfile.TemporaryDirectory() as tmp:
+        dataset = args.dataset
+        if args.limit:
+            dataset = os.path.join(tmp, 'dataset.txt')
+            with open(args.dataset, 'r', encoding='utf-8') as src, \
+                    open(dataset, 'w', encoding='utf-8') as dst:
+                dst.writelines(islice(src, args.limit + 1))
+        argv = ['--dataset', dataset, '--output', os.path.join(tmp, 'submission.csv'),
+                '--backend', args.backend, '--api-url', url, '--no-cache',
+                '--max-in-flight', str(concurrency), '--batch-size', str(args.batch_size),
+                '--pack-size', str(args.pack_size)]
+        for flag in ('stream', 'token_budget', 'json_schema'):
+            if getattr(args, flag):
+                argv.append('--' + flag.replace('_', '-'))
+        if args.model_name:
+            argv += ['--model-name', args.model_name]
+
+        start = time.perf_counter()
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            space_restoration_solution.main(argv)
+        elapsed = time.perf_counter() - start
+        with open(os.path.join(tmp, 'submission.csv'), 'r', encoding='utf-8') as f:
+            processed = sum(1 for _ in f) - 1
+
+    return {
+        'mode': 'main',
+        'concurrency': concurrency,
+        'rows': processed,
+        'seconds': round(elapsed, 4),
+        'rows_per_sec': round(processed / elapsed, 2) if elapsed else 0.0,
+    }
+
+
+def compare(results: Dict, baseline_path: str):
+    """Печатает изменение rows/sec относительно сохранённых результатов"""
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    previous = {(run['mode'], run['concurrency']): run for run in baseline['runs']}
+    print(f"\nСравнение с {baseline_path} (коммит {baseline.get('commit') or '?'}):")
+    for run in results['runs']:
+        old = previous.get((run['mode'], run['concurrency']))
+        if old and old['rows_per_sec']:
+            change = (run['rows_per_sec'] / old['rows_per_sec'] - 1) * 100
+            print(f"  {run['mode']:5} x{run['concurrency']:<3} {old['rows_per_sec']:>9.2f} -> "
+                  f"{run['rows_per_sec']:>9.2f} rows/sec ({change:+.1f}%)")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Бенчмарк SpaceRestoration")
+    parser.add_argument('--dataset', default='dataset_1937770_3.txt')
+    parser.add_argument('--limit', type=int, default=0, help="Сколько строк датасета взять (0 - все)")
+    parser.add_argument('--concurrency', default='1,2,4,8',
+                        help="Уровни параллелизма через запятую")
+    parser.add_argument('--backend', choices=['ollama', 'openai'], default='ollama')
+    parser.add_argument('--url', default=None,
+                        help="Адрес настоящего сервера; без него запускается сервер-заглушка")
+    parser.add_argument('--model-name', default=None)
+    parser.add_argument('--batch-size', type=int, default=1)
+    parser.add_argument('--pack-size', type=int, default=1)
+    parser.add_argument('--stream', action='store_true')
+    parser.add_argument('--token-budget', action='store_true')
+    parser.add_argument('--json-schema', action='store_true')
+    parser.add_argument('--skip-main', action='store_true', help="Не замерять полный конвейер main()")
+    parser.add_argument('--compare-prefix-reuse', action='store_true',
+                        help="Замерить префилл и rows/sec также без переиспользования префикса "
+                             "(с --stream поток дочитывается до конца, без раннего обрыва)")
+    parser.add_argument('--mock-latency', type=float, default=0.02,
+                        help="Задержка заглушки на запрос, с")
+    parser.add_argument('--mock-prompt-latency', type=float, default=0.0,
+                        help="Задержка заглушки на токен промпта, с")
+    parser.add_argument('--mock-token-latency', type=float, default=0.001,
+                        help="Задержка заглушки на сгенерированный токен, с")
+    parser.add_argument('--mock-chatter-tokens', type=int, default=0,
+                        help="Лишние токены заглушки после списка позиций")
+    parser.add_argument('--output', default='bench_results.json')
+    parser.add_argument('--compare', default=None, help="JSON с прошлыми результатами для сравнения")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    levels = [int(level) for level in args.concurrency.split(',') if level.strip()]
+
+    rows = list(DatasetReader(args.dataset))
+    if args.limit:
+        rows = rows[:args.limit]
+
+    server = None
+    url = args.url
+    if url is None:
+        server = MockInferenceServer(latency=args.mock_latency,
+                                     prompt_latency=args.mock_prompt_latency,
+                                     token_latency=args.mock_token_latency,
+                                     chatter_tokens=args.mock_chatter_tokens).start()
+        url = server.url
+        print(f"Сервер-заглушка: {url}")
+
+    results = {
+        'commit': git_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'config': {key: value for key, value in vars(args).items() if key not in ('output', 'compare')},
+        'runs': [],
+    }
+    try:
+        print(f"{'режим':14} {'x':>3} {'строк':>6} {'rows/sec':>9} {'p50':>7} {'p95':>7} {'p99':>7} "
+              f"{'ток.промпта/шт':>15} {'ток.ответа/шт':>14}")
+        variants = [False, True] if args.compare_prefix_reuse else [True]
+        for concurrency in levels:
+            for prefix_reuse in variants:
+                run = run_model_benchmark(args, url, rows, concurrency, prefix_reuse)
+                results['runs'].append(run)
+                print(f"{run['mode']:14} {concurrency:>3} {run['rows']:>6} {run['rows_per_sec']:>9.2f} "
+                      f"{run['latency_p50']:>7.3f} {run['latency_p95']:>7.3f} {run['latency_p99']:>7.3f} "
+                      f"{run['prompt_tokens_per_item']:>15.1f} {run['generated_tokens_per_item']:>14.1f}")
+        if not args.skip_main:
+            for concurrency in levels:
+                run = run_main_benchmark(args, url, concurrency)
+                results['runs'].append(run)
+                print(f"{'main':14} {concurrency:>3} {run['rows']:>6} {run['rows_per_sec']:>9.2f}")
+    finally:
+        if server is not None:
+            server.stop()
+
+    if args.compare_prefix_reuse:
+        print_prefix_reuse(results['runs'])
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"Результаты сохранены в {args.output}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Потоковое чтение датасета и запись результатов без загрузки файлов в память
+"""
+import csv
+import io
+from typing import Iterator, List, Optional, Tuple
+
+# Сколько примеров битых строк держать для отчёта
+MAX_REPORTED_LINES = 5
+
+
+class DatasetReader:
+    """
+    Лениво читает датасет "id,text_no_spaces" и отдаёт пары (id, text).
+    Текст - всё после первой запятой, поэтому запятые внутри текста допустимы.
+    Строки, которые не удалось разобрать, не пропускаются молча: они считаются,
+    первые из них сохраняются для отчёта, а все - пишутся в rejects_path, если он задан
+    """
+
+    def __init__(self, path: str, rejects_path: Optional[str] = None):
+        self.path = path
+        self.rejects_path = rejects_path
+        self.records = 0
+        self.malformed = 0
+        self.examples: List[Tuple[int, str]] = []
+
+    def __iter__(self) -> Iterator[Tuple[int, str]]:
+        rejects = open(self.rejects_path, 'w', encoding='utf-8') if self.rejects_path else None
+        try:
+            with open(self.path, 'r', encoding='utf-8', newline='') as f:
+                header = f.readline()
+                if not header.startswith('id,'):
+                    # Файл без заголовка: первая строка - уже данные
+                    f.seek(0)
+                for line_number, line in enumerate(f, 2 if header.startswith('id,') else 1):
+                    line = line.rstrip('\r\n')
+                    if not line:
+                        continue
+                    record = parse_line(line)
+                    if record is None:
+                        self.malformed += 1
+                        if len(self.examples) < MAX_REPORTED_LINES:
+                            self.examples.append((line_number, line))
+                        if rejects is not None:
+                            rejects.write(f"{line_number}\t{line}\n")
+                        continue
+                    self.records += 1
+                    yield record
+        finally:
+            if rejects is not None:
+                rejects.close()
+
+    def report(self) -> str:
+        """Краткий отчёт о битых строках"""
+        if not self.malformed:
+            return f"Прочитано {self.records} записей, битых строк нет"
+        lines = [f"Прочитано {self.records} записей, битых строк: {self.malformed}"]
+        for line_number, line in self.examples:
+            lines.append(f"  строка {line_number}: {line[:80]}")
+        if self.rejects_path:
+            lines.append(f"  все битые строки записаны в {self.rejects_path}")
+        return '\n'.join(lines)
+
+
+def parse_line(line: str) -> Optional[Tuple[int, str]]:
+    """Разбирает строку датасета; None - строка битая"""
+    row_id, sep, text = line.partition(',')
+    if not sep:
+        return None
+    try:
+        row_id = int(row_id)
+    except ValueError:
+        return None
+    if len(text) >= 2 and text[0] == '"' and text[-1] == '"':
+        # Текст в кавычках по правилам CSV
+        try:
+            text = next(csv.reader(io.StringIO(text)))[0]
+        except (csv.Error, StopIteration, IndexError):
+            return None
+    return row_id, text
+
+
+def count_records(path: str) -> int:
+    """Быстро считает непустые строки с данными (для оценки оставшегося времени)"""
+    count = 0
+    with open(path, 'rb') as f:
+        header = f.readline()
+        if not header.startswith(b'id,'):
+            count += 1 if header.strip() else 0
+        for line in f:
+            if line.strip():
+                count += 1
+    return count
+
+
+class SubmissionWriter:
+    """
+    Построчно пишет результаты в CSV по мере их готовности.
+    quoting: 'minimal' - кавычки только где нужно ("[4, 12]", но []),
+    'all' - список позиций всегда в кавычках, 'none' - без кавычек (0,[4, 12])
+    """
+
+    def __init__(self, path: str, include_text: bool = True, quoting: str = 'minimal'):
+        self.path = path
+        self.include_text = include_text
+        self.quoting = quoting
+        self.rows = 0
+        self._file = open(path, 'w', encoding='utf-8', newline='')
+        self._writer = csv.writer(self._file, lineterminator='\n')
+        if include_text:
+            self._writer.writerow(['id', 'text_no_spaces', 'predicted_positions'])
+        else:
+            self._writer.writerow(['id', 'predicted_positions'])
+
+    def write(self, row_id: int, text: str, positions: List[int]):
+        if self.quoting == 'all':
+            self._file.write(f'{row_id},"{positions}"\n')
+        elif self.quoting == 'none':
+            self._file.write(f'{row_id},{positions}\n')
+        elif self.include_text:
+            self._writer.writerow([row_id, text, str(positions)])
+        else:
+            self._writer.writerow([row_id, str(positions)])
+        self.rows += 1
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -1,57 +1,353 @@
 #!/usr/bin/env python3
 """
-Скрипт для загрузки модели QVikhr-3-1.7B-Instruction-noreasoning.Q4_K_M
+Скрипт для загрузки модели QVikhr-3-1.7B-Instruction-noreasoning.Q4_K_M.
+Файл качается параллельно несколькими HTTP Range-запросами, прерванная загрузка
+продолжается с места остановки, а SHA-256 считается одновременно с загрузкой
 """
+import argparse
+import hashlib
+import json
 import os
-import requests
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from typing import Dict, List, Optional
 
-def download_file(url, filepath):
-    """Загружает файл по URL с прогрессом"""
-    print(f"Загружаем {filepath.name}...")
+import requests
+
+MODEL_NAME = "QVikhr-3-1.7B-Instruction-noreasoning.Q4_K_M"
+# Обычно модели GGUF размещаются на HuggingFace
+MODEL_URL = ("https://huggingface.co/Vikhrmodels/QVikhr-3-1.7B-Instruction-noreasoning-GGUF"
+             f"/resolve/main/{MODEL_NAME}.gguf")
+
+DEFAULT_CONNECTIONS = 8
+# Размер одной записи на диск и одного чтения при подсчёте хэша
+CHUNK_SIZE = 1 << 20
+# Не чаще чем раз в столько секунд сохраняется состояние загрузки
+STATE_SAVE_INTERVAL = 1.0
+GGUF_MAGIC = b'GGUF'
 
-    response = requests.get(url, stream=True)
+
+class DownloadError(Exception):
+    """Загрузка не удалась или файл не прошёл проверку"""
+
+
+def remote_info(url: str, timeout: float = 30) -> Dict:
+    """
+    Размер файла, поддержка Range и SHA-256, если сервер его сообщает
+    (HuggingFace отдаёт SHA-256 LFS-файла в X-Linked-Etag)
+    """
+    response = requests.head(url, allow_redirects=True, timeout=timeout)
     response.raise_for_status()
+    sha256 = None
+    for step in response.history + [response]:
+        etag = (step.headers.get('X-Linked-Etag') or '').strip('"').lower()
+        if len(etag) == 64 and all(ch in '0123456789abcdef' for ch in etag):
+            sha256 = etag
+    size = response.headers.get('Content-Length')
+    return {
+        'size': int(size) if size is not None else None,
+        'ranges': response.headers.get('Accept-Ranges', '').lower() == 'bytes',
+        'sha256': sha256,
+    }
 
-    total_size = int(response.headers.get('content-length', 0))
-    downloaded = 0
 
-    with open(filepath, 'wb') as f:
-        for chunk in response.iter_content(chunk_size=8192):
-            if chunk:
-                f.write(chunk)
-                downloaded += len(chunk)
-                if total_size > 0:
-                    progress = (downloaded / total_size) * 100
-                    print(f"\rПрогресс: {progress:.1f}%", end='', flush=True)
+def file_sha256(path: Path, chunk_size: int = CHUNK_SIZE) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(chunk_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
 
-    print(f"\n✓ {filepath.name} загружен успешно")
 
-def main():
-    models_dir = Path("/app/models")
-    models_dir.mkdir(exist_ok=True)
+def split_segments(size: int, connections: int) -> List[List[int]]:
+    """Делит [0, size) на отрезки [начало, конец) по числу соединений"""
+    connections = max(1, min(connections, size // CHUNK_SIZE or 1))
+    step = max(1, -(-size // connections))
+    return [[start, min(start + step, size)] for start in range(0, size, step)] or [[0, 0]]
 
-    model_name = "QVikhr-3-1.7B-Instruction-noreasoning.Q4_K_M"
-    model_path = models_dir / f"{model_name}.gguf"
 
-    # Проверяем, существует ли уже модель
-    if model_path.exists():
-        print(f"Модель {model_name} уже существует. Пропускаем загрузку.")
-        return
+class SegmentedDownload:
+    """
+    Загрузка файла отрезками в файл .part. Прогресс отрезков хранится в .part.json,
+    поэтому после падения загрузка продолжается с докачки. Отдельный поток читает
+    уже готовый непрерывный префикс файла и считает по нему SHA-256
+    """
+
+    def __init__(self, url: str, path: Path, size: int, connections: int = DEFAULT_CONNECTIONS,
+                 timeout: float = 60, retries: int = 5):
+        self.url = url
+        self.path = path
+        self.size = size
+        self.timeout = timeout
+        self.retries = retries
+        self.part_path = path.with_name(path.name + '.part')
+        self.state_path = path.with_name(path.name + '.part.json')
+        self.segments = split_segments(size, connections)
+        self.done = [0] * len(self.segments)
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._finished = threading.Event()
+        self._last_save = 0.0
+
+    def load_state(self) -> int:
+        """Подхватывает незавершённую загрузку того же файла; возвращает число готовых байт"""
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+            if (state['url'] == self.url and state['size'] == self.size
+                    and self.part_path.exists() and self.part_path.stat().st_size == self.size):
+                self.segments, self.done = state['segments'], state['done']
+                return sum(self.done)
+        except (OSError, ValueError, KeyError):
+            pass
+        with open(self.part_path, 'wb') as f:
+            f.truncate(self.size)
+        return 0
+
+    def save_state(self, force: bool = False):
+        """Атомарно сохраняет прогресс отрезков (через временный файл)"""
+        with self._save_lock:
+            if not force and time.monotonic() - self._last_save < STATE_SAVE_INTERVAL:
+                return
+            self._last_save = time.monotonic()
+            with self._lock:
+                state = {'url': self.url, 'size': self.size,
+                         'segments': self.segments, 'done': list(self.done)}
+            tmp_path = self.state_path.with_name(self.state_path.name + '.tmp')
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(state, f)
+            os.replace(tmp_path, self.state_path)
+
+    def download_segment(self, index: int):
+        start, end = self.segments[index]
+        for attempt in range(self.retries + 1):
+            offset = start + self.done[index]
+            if offset >= end:
+                return
+            try:
+                headers = {'Range': f"bytes={offset}-{end - 1}"}
+                with requests.get(self.url, headers=headers, stream=True,
+                                  timeout=self.timeout) as response:
+                    if response.status_code != 206:
+                        raise DownloadError(f"Сервер не поддерживает Range: {response.status_code}")
+                    # Небуферизованная запись: данные сразу видны потоку подсчёта хэша
+                    with open(self.part_path, 'r+b', buffering=0) as f:
+                        f.seek(offset)
+                        for block in response.iter_content(chunk_size=CHUNK_SIZE):
+                            block = block[:end - offset]
+                            f.write(block)
+                            offset += len(block)
+                            with self._lock:
+                                self.done[index] = offset - start
+                            self.save_state()
+                            if offset >= end:
+                                return
+            except requests.RequestException as error:
+                if attempt == self.retries:
+                    raise
+                print(f"\nОтрезок {index}: {error}, повтор через {2 ** attempt} с")
+                time.sleep(2 ** attempt)
+        if start + self.done[index] < end:
+            raise DownloadError(f"Отрезок {index} загружен не полностью")
+
+    def contiguous_prefix(self) -> int:
+        """Сколько байт с начала файла уже загружено без пропусков"""
+        with self._lock:
+            prefix = 0
+            for (start, end), done in zip(self.segments, self.done):
+                prefix = start + done
+                if start + done < end:
+                    break
+            return prefix
+
+    def hash_prefix(self, digest):
+        """Считает хэш по мере того, как растёт загруженный префикс"""
+        hashed = 0
+        # Без буфера чтения: иначе после seek можно прочитать устаревшие нули из буфера
+        with open(self.part_path, 'rb', buffering=0) as f:
+            while hashed < self.size:
+                frontier = self.contiguous_prefix()
+                if frontier <= hashed:
+                    if self._finished.is_set():
+                        return
+                    time.sleep(0.05)
+                    continue
+                f.seek(hashed)
+                while hashed < frontier:
+                    block = f.read(min(CHUNK_SIZE, frontier - hashed))
+                    if not block:
+                        break
+                    digest.update(block)
+                    hashed += len(block)
+
+    def run(self) -> str:
+        """Загружает файл в .part и возвращает его SHA-256"""
+        resumed = self.load_state()
+        if resumed:
+            print(f"Продолжаем загрузку с {resumed / 2**20:.1f} МБ из {self.size / 2**20:.1f} МБ")
+        digest = hashlib.sha256()
+        hasher = threading.Thread(target=self.hash_prefix, args=(digest,), daemon=True)
+        hasher.start()
+
+        start_time = time.monotonic()
+        try:
+            with ThreadPoolExecutor(max_workers=len(self.segments)) as executor:
+                futures = [executor.submit(self.download_segment, index)
+                           for index in range(len(self.segments))]
+                while not all(future.done() for future in futures):
+                    time.sleep(0.5)
+                    downloaded = sum(self.done)
+                    speed = (downloaded - resumed) / max(time.monotonic() - start_time, 1e-9)
+                    print(f"\rПрогресс: {downloaded / self.size * 100:.1f}% "
+                          f"({speed / 2**20:.1f} МБ/с)", end='', flush=True)
+                for future in futures:
+                    future.result()
+        finally:
+            self._finished.set()
+            self.save_state(force=True)
+        hasher.join()
+        print()
+        return digest.hexdigest()
+
+
+def download_stream(url: str, part_path: Path, timeout: float = 60) -> str:
+    """Загрузка одним соединением, если сервер не поддерживает Range или не сообщает размер"""
+    digest = hashlib.sha256()
+    with requests.get(url, stream=True, timeout=timeout) as response:
+        response.raise_for_status()
+        with open(part_path, 'wb') as f:
+            for block in response.iter_content(chunk_size=CHUNK_SIZE):
+                f.write(block)
+                digest.update(block)
+    return digest.hexdigest()
+
 
-    # URL для загрузки модели (пример, может потребоваться изменить)
-    # Обычно модели GGUF размещаются на HuggingFace
-    model_url = f"https://huggingface.co/Vikhrmodels/QVikhr-3-1.7B-Instruction-noreasoning-GGUF/resolve/main/{model_name}.gguf"
+def sidecar_path(path: Path) -> Path:
+    return path.with_name(path.name + '.sha256')
+
+
+def write_sidecar(path: Path, sha256: str):
+    """Запоминает проверенный хэш вместе с размером и временем изменения файла"""
+    stat = path.stat()
+    with open(sidecar_path(path), 'w', encoding='utf-8') as f:
+        json.dump({'sha256': sha256, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}, f)
+
+
+def verify_existing(path: Path, size: Optional[int], sha256: Optional[str]) -> bool:
+    """
+    Проверяет уже лежащий файл: заголовок GGUF, размер и SHA-256. Хэш пересчитывается,
+    только если файл изменился после прошлой проверки; без ожидаемого хэша файл
+    сверяется с хэшем, сохранённым при прошлой проверке
+    """
+    stat = path.stat()
+    with open(path, 'rb') as f:
+        if f.read(len(GGUF_MAGIC)) != GGUF_MAGIC:
+            print("Файл не является GGUF")
+            return False
+    if size is not None and stat.st_size != size:
+        print(f"Размер файла {stat.st_size} не совпадает с ожидаемым {size}")
+        return False
+    verified = {}
+    try:
+        with open(sidecar_path(path), 'r', encoding='utf-8') as f:
+            verified = json.load(f)
+        if (verified['size'] == stat.st_size and verified['mtime_ns'] == stat.st_mtime_ns
+                and (sha256 is None or verified['sha256'] == sha256)):
+            return True
+    except (OSError, ValueError, KeyError, TypeError):
+        verified = {}
+    expected = sha256 or verified.get('sha256')
+    if expected is None:
+        return True
+    print("Проверяем SHA-256...")
+    actual = file_sha256(path)
+    if actual != expected:
+        print(f"SHA-256 не совпадает: {actual} вместо {expected}")
+        return False
+    write_sidecar(path, actual)
+    return True
+
+
+def download_file(url: str, filepath: Path, connections: int = DEFAULT_CONNECTIONS,
+                  sha256: Optional[str] = None, info: Optional[Dict] = None):
+    """Загружает файл по URL, проверяет размер и SHA-256 и только потом кладёт на место"""
+    print(f"Загружаем {filepath.name}...")
+    info = info or remote_info(url)
+    sha256 = sha256 or info['sha256']
+
+    part_path = filepath.with_name(filepath.name + '.part')
+    if info['ranges'] and info['size']:
+        download = SegmentedDownload(url, filepath, info['size'], connections)
+        actual = download.run()
+    else:
+        actual = download_stream(url, part_path)
+        download = None
+
+    if info['size'] is not None and part_path.stat().st_size != info['size']:
+        raise DownloadError(f"Размер {part_path.stat().st_size} не совпадает с {info['size']}")
+    if sha256 is not None and actual != sha256:
+        # Повреждённые данные докачивать бессмысленно
+        part_path.unlink()
+        if download is not None:
+            download.state_path.unlink(missing_ok=True)
+        raise DownloadError(f"SHA-256 не совпадает: {actual} вместо {sha256}")
+
+    os.replace(part_path, filepath)
+    if download is not None:
+        download.state_path.unlink(missing_ok=True)
+    write_sidecar(filepath, actual)
+    print(f"✓ {filepath.name} загружен успешно, SHA-256 {actual}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Загрузка GGUF-модели")
+    parser.add_argument('--url', default=MODEL_URL)
+    parser.add_argument('--models-dir', default="/app/models")
+    parser.add_argument('--model-name', default=MODEL_NAME)
+    parser.add_argument('--connections', type=int, default=DEFAULT_CONNECTIONS,
+                        help="Число параллельных соединений")
+    parser.add_argument('--sha256', default=None,
+                        help="Ожидаемый SHA-256 (по умолчанию берётся из ответа сервера)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    models_dir = Path(args.models_dir)
+    models_dir.mkdir(parents=True, exist_ok=True)
+    model_path = models_dir / f"{args.model_name}.gguf"
 
     try:
-        download_file(model_url, model_path)
-        print(f"Модель {model_name} успешно загружена в {model_path}")
-    except Exception as e:
-        print(f"Ошибка при загрузке модели: {e}")
-        # Если не удается загрузить, создаем заглушку
-        print("Создаем заглушку для тестирования...")
-        with open(model_path, 'w') as f:
-            f.write("# Placeholder model file\n")
+        info = remote_info(args.url)
+    except requests.RequestException as e:
+        print(f"Не удалось получить информацию о файле: {e}")
+        info = None
+    sha256 = (args.sha256 or (info or {}).get('sha256') or '').lower() or None
+
+    # Проверяем, существует ли уже модель и цела ли она
+    if model_path.exists():
+        if verify_existing(model_path, (info or {}).get('size'), sha256):
+            print(f"Модель {args.model_name} уже существует. Пропускаем загрузку.")
+            return 0
+        print("Файл модели повреждён или загружен не полностью, загружаем заново")
+        model_path.unlink()
+        sidecar_path(model_path).unlink(missing_ok=True)
+
+    if info is None:
+        return 1
+    try:
+        download_file(args.url, model_path, args.connections, sha256, info)
+        print(f"Модель {args.model_name} успешно загружена в {model_path}")
+        return 0
+    except (requests.RequestException, DownloadError, OSError) as e:
+        print(f"\nОшибка при загрузке модели: {e}")
+        if model_path.with_name(model_path.name + '.part').exists():
+            print("Загруженная часть сохранена, следующий запуск продолжит загрузку")
+        return 1
+
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(main())
@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+"""
+Пакетная оценка качества сегментации на всём датасете.
+Позиции пробелов кодируются битовыми масками в упакованных массивах NumPy
+(по целому числу байт на строку), после чего precision, recall и F1 по строкам,
+macro и micro считаются несколькими векторными проходами
+"""
+import argparse
+import csv
+import json
+import re
+from itertools import chain
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from dataset_io import DatasetReader
+from submission import read_predictions
+
+# Число единичных битов в каждом значении байта
+POPCOUNT = np.array([bin(value).count('1') for value in range(256)], dtype=np.int64)
+
+# Границы корзин по длине текста
+LENGTH_BUCKETS = (10, 20, 40, 80)
+
+CYRILLIC_PATTERN = re.compile(r'[а-яёА-ЯЁ]')
+LATIN_PATTERN = re.compile(r'[a-zA-Z]')
+DIGIT_PATTERN = re.compile(r'\d')
+
+
+def script_mix(text: str) -> str:
+    """Состав текста по алфавитам: например, 'cyrillic+latin+digits'"""
+    parts = [name for name, pattern in (('cyrillic', CYRILLIC_PATTERN), ('latin', LATIN_PATTERN),
+                                        ('digits', DIGIT_PATTERN)) if pattern.search(text)]
+    return '+'.join(parts) or 'other'
+
+
+def length_bucket_names() -> List[str]:
+    bounds = (0,) + LENGTH_BUCKETS
+    names = [f"{low + 1}-{high}" for low, high in zip(bounds, bounds[1:])]
+    return names + [f"{LENGTH_BUCKETS[-1] + 1}+"]
+
+
+def clean_positions(value) -> Optional[List[int]]:
+    """Список целых позиций; None - значение не разобралось или содержит не числа"""
+    if not isinstance(value, (list, tuple)):
+        return None
+    if not all(isinstance(pos, int) and not isinstance(pos, bool) for pos in value):
+        return None
+    return list(value)
+
+
+def read_positions(path: str) -> Dict[int, Optional[List[int]]]:
+    """Позиции из файла любого формата submission.py или журнала .jsonl"""
+    return {row_id: clean_positions(value) for row_id, value in read_predictions(path)}
+
+
+class BoundaryMasks:
+    """
+    Позиции пробелов всех строк в одном упакованном массиве uint8.
+    Строка i занимает байты [byte_offsets[i], byte_offsets[i + 1]), бит p - пробел перед символом p
+    """
+
+    def __init__(self, lengths: np.ndarray):
+        self.lengths = lengths
+        row_bytes = np.maximum(1, (lengths + 7) // 8)
+        self.byte_offsets = np.concatenate(([0], np.cumsum(row_bytes)))
+        self.bits = np.zeros(self.byte_offsets[-1], dtype=np.uint8)
+        self.invalid = 0
+
+    @classmethod
+    def from_lists(cls, lengths: np.ndarray, positions: List[Optional[List[int]]]) -> 'BoundaryMasks':
+        """Строит маски из списков позиций; None - позиций нет"""
+        masks = cls(lengths)
+        counts = np.array([len(value) if value else 0 for value in positions], dtype=np.int64)
+        values = np.fromiter(chain.from_iterable(value for value in positions if value),
+                             dtype=np.int64, count=int(counts.sum()))
+        rows = np.repeat(np.arange(len(lengths)), counts)
+        masks.set_positions(rows, values)
+        return masks
+
+    def set_positions(self, rows: np.ndarray, values: np.ndarray):
+        """Выставляет биты; позиции вне 0 < p < len(text) отбрасываются и считаются"""
+        valid = (values > 0) & (values < self.lengths[rows])
+        self.invalid = int(len(values) - valid.sum())
+        bit_index = self.byte_offsets[rows[valid]] * 8 + values[valid]
+        np.bitwise_or.at(self.bits, bit_index >> 3, (0x80 >> (bit_index & 7)).astype(np.uint8))
+
+    def row_counts(self, bits: Optional[np.ndarray] = None) -> np.ndarray:
+        """Число выставленных битов в каждой строке"""
+        bits = self.bits if bits is None else bits
+        return np.add.reduceat(POPCOUNT[bits], self.byte_offsets[:-1])
+
+
+def safe_divide(numerator: np.ndarray, denominator: np.ndarray, empty: float) -> np.ndarray:
+    """Поэлементное деление; там, где знаменатель 0, подставляется empty"""
+    result = np.full(np.shape(numerator), empty, dtype=np.float64)
+    np.divide(numerator, denominator, out=result, where=denominator > 0)
+    return result
+
+
+def summarize(tp: np.ndarray, n_pred: np.ndarray, n_gold: np.ndarray,
+              f1: np.ndarray, precision: np.ndarray, recall: np.ndarray) -> Dict[str, float]:
+    """Macro и micro метрики по набору строк"""
+    tp_sum, pred_sum, gold_sum = int(tp.sum()), int(n_pred.sum()), int(n_gold.sum())
+    # Как в calculate_f1_score: пустое предсказание при непустом эталоне (и наоборот) - 0
+    micro_p = tp_sum / pred_sum if pred_sum else float(gold_sum == 0)
+    micro_r = tp_sum / gold_sum if gold_sum else float(pred_sum == 0)
+    micro_f1 = 2 * tp_sum / (pred_sum + gold_sum) if pred_sum + gold_sum else 1.0
+    return {
+        'rows': int(len(tp)),
+        'macro_precision': float(precision.mean()) if len(tp) else 0.0,
+        'macro_recall': float(recall.mean()) if len(tp) else 0.0,
+        'macro_f1': float(f1.mean()) if len(tp) else 0.0,
+        'micro_precision': micro_p,
+        'micro_recall': micro_r,
+        'micro_f1': micro_f1,
+    }
+
+
+def evaluate(rows: Iterable[Tuple[int, str]], gold: Dict[int, Optional[List[int]]],
+             predictions: Dict[int, Optional[List[int]]]) -> Dict:
+    """
+    Считает метрики для всех строк датасета. Как и SpaceRestoration.calculate_f1_score,
+    строка без пробелов в эталоне и предсказании получает F1 = 1.
+    None в словарях - значение не разобралось: строка без эталона не оценивается,
+    предсказание считается пустым; такие строки подсчитываются в отчёте
+    """
+    ids, lengths, mixes = [], [], []
+    gold_values, pred_values = [], []
+    missing = unparsable = unparsable_gold = 0
+    for row_id, text in rows:
+        if row_id not in gold:
+            continue
+        if gold[row_id] is None:
+            unparsable_gold += 1
+            continue
+        ids.append(row_id)
+        lengths.append(len(text))
+        mixes.append(script_mix(text))
+        gold_values.append(gold[row_id])
+        if row_id not in predictions:
+            missing += 1
+        elif predictions[row_id] is None:
+            unparsable += 1
+        pred_values.append(predictions.get(row_id))
+
+    lengths = np.array(lengths, dtype=np.int64)
+    gold_masks = BoundaryMasks.from_lists(lengths, gold_values)
+    pred_masks = BoundaryMasks.from_lists(lengths, pred_values)
+
+    tp = gold_masks.row_counts(gold_masks.bits & pred_masks.bits)
+    n_gold = gold_masks.row_counts()
+    n_pred = pred_masks.row_counts()
+
+    both_empty = (n_gold == 0) & (n_pred == 0)
+    precision = safe_divide(tp, n_pred, 0.0)
+    recall = safe_divide(tp, n_gold, 0.0)
+    f1 = safe_divide(2 * tp, n_pred + n_gold, 0.0)
+    precision[both_empty] = recall[both_empty] = f1[both_empty] = 1.0
+
+    report = {
+        'overall': summarize(tp, n_pred, n_gold, f1, precision, recall),
+        'missing_predictions': missing,
+        'unparsable_predictions': unparsable,
+        'unparsable_gold': unparsable_gold,
+        'invalid_predicted_positions': pred_masks.invalid,
+        'by_length': {},
+        'by_script': {},
+    }
+
+    buckets = np.digitize(lengths, np.array(LENGTH_BUCKETS) + 1)
+    for index, name in enumerate(length_bucket_names()):
+        selected = buckets == index
+        if selected.any():
+            report['by_length'][name] = summarize(tp[selected], n_pred[selected], n_gold[selected],
+                                                  f1[selected], precision[selected], recall[selected])
+
+    mixes = np.array(mixes)
+    for name in sorted(set(mixes.tolist())):
+        selected = mixes == name
+        report['by_script'][name] = summarize(tp[selected], n_pred[selected], n_gold[selected],
+                                              f1[selected], precision[selected], recall[selected])
+
+    report['per_row'] = {
+        'id': ids,
+        'precision': precision,
+        'recall': recall,
+        'f1': f1,
+    }
+    return report
+
+
+def evaluate_files(dataset_path: str, gold_path: str, predictions_path: str) -> Dict:
+    """Оценка по файлам датасета, эталона и предсказаний"""
+    return evaluate(DatasetReader(dataset_path), read_positions(gold_path),
+                    read_positions(predictions_path))
+
+
+def format_report(report: Dict) -> str:
+    """Текстовая таблица с метриками"""
+    header = f"{'':24} {'строк':>7} {'macro F1':>9} {'micro P':>8} {'micro R':>8} {'micro F1':>9}"
+    lines = [header]
+
+    def add(name, metrics):
+        lines.append(f"{name:24} {metrics['rows']:>7} {metrics['macro_f1']:>9.4f} "
+                     f"{metrics['micro_precision']:>8.4f} {metrics['micro_recall']:>8.4f} "
+                     f"{metrics['micro_f1']:>9.4f}")
+
+    add('всего', report['overall'])
+    for name, metrics in report['by_length'].items():
+        add(f"длина {name}", metrics)
+    for name, metrics in report['by_script'].items():
+        add(name, metrics)
+    lines.append(f"Строк без предсказания: {report['missing_predictions']}, "
+                 f"неразобранных предсказаний: {report['unparsable_predictions']}, "
+                 f"позиций вне текста: {report['invalid_predicted_positions']}")
+    if report['unparsable_gold']:
+        lines.append(f"Строк с неразобранным эталоном (не оценивались): {report['unparsable_gold']}")
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Оценка качества сегментации на датасете")
+    parser.add_argument('--dataset', default='dataset_1937770_3.txt')
+    parser.add_argument('--gold', required=True, help="CSV с эталонными позициями (id, positions)")
+    parser.add_argument('--predictions', default='submission.csv',
+                        help="CSV с предсказаниями или журнал .jsonl")
+    parser.add_argument('--output', default=None, help="Сохранить метрики в JSON")
+    parser.add_argument('--per-row', default=None, help="Сохранить метрики по строкам в CSV")
+    args = parser.parse_args()
+
+    report = evaluate_files(args.dataset, args.gold, args.predictions)
+    print(format_report(report))
+
+    per_row = report.pop('per_row')
+    if args.per_row:
+        with open(args.per_row, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f, lineterminator='\n')
+            writer.writerow(['id', 'precision', 'recall', 'f1'])
+            writer.writerows(zip(per_row['id'], per_row['precision'].round(4),
+                                 per_row['recall'].round(4), per_row['f1'].round(4)))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
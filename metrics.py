@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Метрики запросов к LLM: трассировка каждого запроса в JSON Lines
+и агрегаты в текстовом формате Prometheus (файл или HTTP-эндпоинт /metrics)
+"""
+import json
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+
+# Границы корзин гистограмм задержек, с
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Поля записи, которые суммируются в счётчики
+COUNTER_FIELDS = (
+    'items', 'prompt_eval_count', 'eval_count', 'tokens_saved', 'parse_failures', 'retries',
+    'failovers', 'prompt_cached_tokens',
+)
+# Поля записи в наносекундах (как в ответе Ollama), которые суммируются в секундах
+DURATION_FIELDS = ('prompt_eval_duration', 'eval_duration', 'load_duration')
+# Поля записи, по которым строятся гистограммы
+HISTOGRAM_FIELDS = ('queue_wait', 'http_latency', 'time_to_first_token')
+
+
+class Histogram:
+    """Гистограмма с накопительными корзинами, как в Prometheus"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+
+class MetricsRecorder:
+    """
+    Потокобезопасный сборщик метрик. Каждый вызов record() - один запрос к бэкенду:
+    запись уходит в JSONL-трассу (если задан trace_path) и в агрегаты
+    """
+
+    def __init__(self, trace_path: Optional[str] = None, prefix: str = 'space_restoration'):
+        self.prefix = prefix
+        self.counters = Counter()
+        self.histograms = {name: Histogram() for name in HISTOGRAM_FIELDS}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._trace = open(trace_path, 'w', encoding='utf-8') if trace_path else None
+        self._server = None
+
+    def set_queue_wait(self, seconds: float):
+        """Время ожидания в очереди для запросов, которые выполнит текущий поток"""
+        self._local.queue_wait = seconds
+
+    def record(self, **fields):
+        """Сохраняет метрики одного запроса"""
+        fields['timestamp'] = time.time()
+        queue_wait = getattr(self._local, 'queue_wait', None)
+        if queue_wait is not None:
+            fields.setdefault('queue_wait', queue_wait)
+        with self._lock:
+            self.counters['requests'] += 1
+            if fields.get('error'):
+                self.counters['errors'] += 1
+            for name in COUNTER_FIELDS:
+                self.counters[name] += fields.get(name) or 0
+            for name in DURATION_FIELDS:
+                self.counters[name] += (fields.get(name) or 0) / 1e9
+            for name in HISTOGRAM_FIELDS:
+                if fields.get(name) is not None:
+                    self.histograms[name].observe(fields[name])
+            if self._trace is not None:
+                self._trace.write(json.dumps(fields, ensure_ascii=False) + '\n')
+
+    def increment(self, name: str, value: float = 1):
+        """Увеличивает произвольный счётчик (например, попадания в кэш)"""
+        with self._lock:
+            self.counters[name] += value
+
+    def prometheus_text(self) -> str:
+        """Агрегаты в текстовом формате экспозиции Prometheus"""
+        lines = []
+        with self._lock:
+            for name, value in sorted(self.counters.items()):
+                metric = f"{self.prefix}_{name}_total"
+                if name in DURATION_FIELDS:
+                    metric = f"{self.prefix}_{name}_seconds_total"
+                lines.append(f"# TYPE {metric} counter")
+                lines.append(f"{metric} {value:g}")
+            for name, histogram in self.histograms.items():
+                if not histogram.count:
+                    continue
+                metric = f"{self.prefix}_{name}_seconds"
+                lines.append(f"# TYPE {metric} histogram")
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    lines.append(f'{metric}_bucket{{le="{bound:g}"}} {count}')
+                lines.append(f'{metric}_bucket{{le="+Inf"}} {histogram.count}')
+                lines.append(f"{metric}_sum {histogram.sum:g}")
+                lines.append(f"{metric}_count {histogram.count}")
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, path: str):
+        """Записывает агрегаты в файл (например, для node_exporter textfile collector)"""
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(self.prometheus_text())
+
+    def serve(self, port: int, host: str = '0.0.0.0'):
+        """Поднимает HTTP-эндпоинт /metrics в фоновом потоке"""
+        recorder = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                if self.path != '/metrics':
+                    self.send_error(404)
+                    return
+                body = recorder.prometheus_text().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    def summary(self) -> Dict[str, float]:
+        """Основные агрегаты для итогового отчёта"""
+        with self._lock:
+            result = dict(self.counters)
+            for name, histogram in self.histograms.items():
+                if histogram.count:
+                    result[f"{name}_avg"] = histogram.sum / histogram.count
+            return result
+
+    def close(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        if self._trace is not None:
+            self._trace.close()
+            self._trace = None
@@ -0,0 +1,360 @@
+#!/usr/bin/env python3
+"""
+Локальный сервер-заглушка, имитирующий Ollama (/api/generate) и vLLM (/v1/completions)
+с настраиваемой задержкой. Нужен для бенчмарков и проверок без GPU и настоящей модели.
+Может также раздавать файлы с поддержкой Range (проверка download_model.py)
+"""
+import argparse
+import ast
+import csv
+import json
+import os
+import re
+import sys
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Тексты из последнего блока <input> промпта
+INPUT_PATTERN = re.compile(r'<input>(.*?)</input>', flags=re.DOTALL)
+TEXT_PATTERN = re.compile(r'<text[^>]*>\s*(.*?)\s*</text>', flags=re.DOTALL)
+# Грубое деление ответа на токены: числа по одной цифре, остальное по символу
+TOKEN_PATTERN = re.compile(r'\d|\s+|[^\d\s]')
+
+
+def class_transition_positions(text: str) -> List[int]:
+    """Ответ по умолчанию: пробелы на границах кириллицы, латиницы и цифр"""
+    def char_class(ch):
+        if ch.isdigit():
+            return 'digit'
+        return 'latin' if ch.isascii() and ch.isalpha() else 'other'
+    return [i for i in range(1, len(text)) if char_class(text[i]) != char_class(text[i - 1])]
+
+
+def load_answers(dataset_path: str, submission_path: str) -> Dict[str, List[int]]:
+    """Готовые ответы по датасету и файлу с позициями: текст -> позиции"""
+    with open(submission_path, 'r', encoding='utf-8', newline='') as f:
+        positions = {row['id']: row['predicted_positions'] for row in csv.DictReader(f)}
+    answers = {}
+    with open(dataset_path, 'r', encoding='utf-8') as f:
+        next(f)
+        for line in f:
+            row_id, _, text = line.rstrip('\r\n').partition(',')
+            if row_id in positions:
+                answers[text] = ast.literal_eval(positions[row_id])
+    return answers
+
+
+def count_tokens(text: str) -> int:
+    """Примерное число токенов: около трёх символов на токен"""
+    return max(1, len(text) // 3)
+
+
+class QuietHTTPServer(ThreadingHTTPServer):
+    """
+    ThreadingHTTPServer, который не печатает трассировку, когда клиент закрыл соединение:
+    при досрочной остановке потока (--stream) так заканчивается каждый запрос
+    """
+
+    def handle_error(self, request, client_address):
+        if isinstance(sys.exc_info()[1], ConnectionError):
+            return
+        super().handle_error(request, client_address)
+
+
+class MockInferenceServer:
+    """
+    Сервер-заглушка. Время ответа: latency + prompt_latency * токены_промпта
+    + token_latency * токены_ответа. chatter_tokens - сколько лишних токенов
+    «модель» генерирует после списка позиций (проверка досрочной остановки).
+    Как Ollama и vLLM, сервер помнит prefix_slots последних промптов и не считает
+    префилл для начала промпта, совпавшего с одним из них
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, latency: float = 0.0,
+                 prompt_latency: float = 0.0, token_latency: float = 0.0,
+                 chatter_tokens: int = 0, model_name: str = 'mock-model',
+                 answer: Optional[Callable[[str], List[int]]] = None,
+                 files: Optional[Dict[str, str]] = None, prefix_slots: int = 4):
+        self.latency = latency
+        self.prompt_latency = prompt_latency
+        self.token_latency = token_latency
+        self.chatter_tokens = chatter_tokens
+        self.model_name = model_name
+        self.answer = answer or class_transition_positions
+        # Раздаваемые файлы: путь в URL -> путь на диске
+        self.files = files or {}
+        self.requests = 0
+        # Сколько байт раздаваемых файлов отправлено (проверка докачки)
+        self.file_bytes = 0
+        self._prefixes = deque(maxlen=prefix_slots) if prefix_slots > 0 else None
+        self._lock = threading.Lock()
+        self._httpd = QuietHTTPServer((host, port), self._make_handler())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> 'MockInferenceServer':
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        """Обслуживает запросы в текущем потоке (до Ctrl-C)"""
+        try:
+            self._httpd.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self._httpd.server_close()
+
+    def stop(self):
+        # shutdown() ждёт завершения serve_forever, поэтому вызывается только для запущенного
+        if self._thread is not None:
+            self._httpd.shutdown()
+            self._thread = None
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def complete(self, prompt: str) -> str:
+        """Ответ «модели» на промпт: список позиций или по строке на каждый текст"""
+        blocks = INPUT_PATTERN.findall(prompt)
+        texts = TEXT_PATTERN.findall(blocks[-1]) if blocks else []
+        if len(texts) == 1:
+            return str(self.answer(texts[0]))
+        return '\n'.join(f"{number}: {self.answer(text)}" for number, text in enumerate(texts, 1))
+
+    def prefill(self, prompt: str) -> Tuple[int, int]:
+        """Токены промпта: всего и взятые из кэша префикса"""
+        cached = 0
+        if self._prefixes is not None:
+            with self._lock:
+                for previous in self._prefixes:
+                    cached = max(cached, len(os.path.commonprefix([previous, prompt])))
+                self._prefixes.append(prompt)
+        total = count_tokens(prompt)
+        return total, min(total, cached // 3)
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def send_json(self, data, status: int = 200):
+                body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def send_chunk(self, data: bytes):
+                self.wfile.write(b'%x\r\n%s\r\n' % (len(data), data))
+                self.wfile.flush()
+
+            def send_file(self, path: str, head: bool = False):
+                """Отдаёт файл целиком или один диапазон из заголовка Range"""
+                size = os.path.getsize(path)
+                start, end = 0, size - 1
+                match = re.fullmatch(r'bytes=(\d*)-(\d*)', self.headers.get('Range', ''))
+                if match and (match.group(1) or match.group(2)):
+                    if match.group(1):
+                        start = int(match.group(1))
+                        end = min(int(match.group(2) or end), size - 1)
+                    else:
+                        start = max(0, size - int(match.group(2)))
+                    if start > end:
+                        self.send_response(416)
+                        self.send_header('Content-Range', f"bytes */{size}")
+                        self.send_header('Content-Length', '0')
+                        self.end_headers()
+                        return
+                    self.send_response(206)
+                    self.send_header('Content-Range', f"bytes {start}-{end}/{size}")
+                else:
+                    self.send_response(200)
+                self.send_header('Accept-Ranges', 'bytes')
+                self.send_header('Content-Type', 'application/octet-stream')
+                self.send_header('Content-Length', str(end - start + 1))
+                self.end_headers()
+                if head:
+                    return
+                try:
+                    with open(path, 'rb') as f:
+                        f.seek(start)
+                        remaining = end - start + 1
+                        while remaining > 0:
+                            block = f.read(min(1 << 20, remaining))
+                            if not block:
+                                break
+                            self.wfile.write(block)
+                            remaining -= len(block)
+                            with server._lock:
+                                server.file_bytes += len(block)
+                except ConnectionError:
+                    self.close_connection = True
+
+            def do_HEAD(self):
+                if self.path in server.files:
+                    self.send_file(server.files[self.path], head=True)
+                else:
+                    self.send_json({'error': 'not found'}, 404)
+
+            def do_GET(self):
+                if self.path in server.files:
+                    self.send_file(server.files[self.path])
+                elif self.path == '/api/tags':
+                    self.send_json({'models': [{'name': server.model_name}]})
+                elif self.path == '/health':
+                    self.send_json({})
+                elif self.path == '/v1/models':
+                    self.send_json({'data': [{'id': server.model_name, 'object': 'model'}]})
+                else:
+                    self.send_json({'error': 'not found'}, 404)
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                payload = json.loads(self.rfile.read(length) or b'{}')
+                with server._lock:
+                    server.requests += 1
+                if self.path == '/api/generate':
+                    self.ollama_generate(payload)
+                elif self.path == '/v1/completions':
+                    self.openai_completions(payload)
+                else:
+                    self.send_json({'error': 'not found'}, 404)
+
+            def ollama_generate(self, payload):
+                prompt = payload.get('prompt', '')
+                answer = server.complete(prompt) if prompt else ''
+                tokens = TOKEN_PATTERN.findall(answer)
+                tokens += [' ...'] * server.chatter_tokens
+                num_predict = (payload.get('options') or {}).get('num_predict')
+                if num_predict is not None:
+                    tokens = tokens[:num_predict]
+                # Как у Ollama, prompt_eval_count - только токены, посчитанные заново
+                total, cached = server.prefill(payload.get('system', '') + prompt)
+                prompt_tokens = total - cached
+
+                prefill = server.latency + server.prompt_latency * prompt_tokens
+                time.sleep(prefill)
+                stats = {
+                    'model': server.model_name,
+                    'done': True,
+                    'load_duration': 0,
+                    'prompt_eval_count': prompt_tokens,
+                    'prompt_eval_duration': int(prefill * 1e9),
+                    'eval_count': len(tokens),
+                    'eval_duration': int(server.token_latency * len(tokens) * 1e9),
+                }
+
+                if not payload.get('stream', True):
+                    time.sleep(server.token_latency * len(tokens))
+                    stats['response'] = ''.join(tokens)
+                    stats['total_duration'] = stats['prompt_eval_duration'] + stats['eval_duration']
+                    self.send_json(stats)
+                    return
+
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/x-ndjson')
+                self.send_header('Transfer-Encoding', 'chunked')
+                self.end_headers()
+                try:
+                    for token in tokens:
+                        time.sleep(server.token_latency)
+                        line = {'model': server.model_name, 'response': token, 'done': False}
+                        self.send_chunk(json.dumps(line, ensure_ascii=False).encode('utf-8') + b'\n')
+                    stats['response'] = ''
+                    stats['total_duration'] = stats['prompt_eval_duration'] + stats['eval_duration']
+                    self.send_chunk(json.dumps(stats).encode('utf-8') + b'\n')
+                    self.wfile.write(b'0\r\n\r\n')
+                except ConnectionError:
+                    # Клиент закрыл соединение - генерация прекращается
+                    self.close_connection = True
+
+            def openai_completions(self, payload):
+                prompts = payload.get('prompt', [])
+                if isinstance(prompts, str):
+                    prompts = [prompts]
+                answers = [server.complete(prompt) for prompt in prompts]
+                max_tokens = payload.get('max_tokens')
+                token_counts = [len(TOKEN_PATTERN.findall(answer)) for answer in answers]
+                if max_tokens is not None:
+                    token_counts = [min(count, max_tokens) for count in token_counts]
+                prefills = [server.prefill(prompt) for prompt in prompts]
+                prompt_tokens = sum(total for total, _ in prefills)
+                cached_tokens = sum(cached for _, cached in prefills)
+
+                # Пакет обрабатывается одновременно: время определяет самый длинный ответ
+                time.sleep(server.latency + server.prompt_latency * (prompt_tokens - cached_tokens)
+                           + server.token_latency * max(token_counts, default=0))
+                self.send_json({
+                    'object': 'text_completion',
+                    'model': payload.get('model', server.model_name),
+                    'choices': [
+                        {'index': i, 'text': answer, 'finish_reason': 'stop'}
+                        for i, answer in enumerate(answers)
+                    ],
+                    'usage': {
+                        'prompt_tokens': prompt_tokens,
+                        'completion_tokens': sum(token_counts),
+                        'total_tokens': prompt_tokens + sum(token_counts),
+                        'prompt_tokens_details': {'cached_tokens': cached_tokens},
+                    },
+                })
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сервер-заглушка Ollama/vLLM")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=11434)
+    parser.add_argument('--latency', type=float, default=0.05, help="Задержка на запрос, с")
+    parser.add_argument('--prompt-latency', type=float, default=0.0,
+                        help="Задержка на токен промпта, с")
+    parser.add_argument('--token-latency', type=float, default=0.0,
+                        help="Задержка на сгенерированный токен, с")
+    parser.add_argument('--chatter-tokens', type=int, default=0,
+                        help="Лишние токены после списка позиций")
+    parser.add_argument('--dataset', help="Датасет для готовых ответов (вместе с --answers)")
+    parser.add_argument('--answers', help="Файл с позициями, которые сервер вернёт для датасета")
+    parser.add_argument('--file', action='append', default=[],
+                        help="Раздавать файл по адресу /files/<имя> (можно несколько раз)")
+    parser.add_argument('--prefix-slots', type=int, default=4,
+                        help="Сколько последних промптов помнит кэш префикса (0 - без кэша)")
+    args = parser.parse_args()
+
+    answer = None
+    if args.dataset and args.answers:
+        answers = load_answers(args.dataset, args.answers)
+        answer = lambda text: answers.get(text, class_transition_positions(text))
+
+    server = MockInferenceServer(args.host, args.port, latency=args.latency,
+                                 prompt_latency=args.prompt_latency,
+                                 token_latency=args.token_latency,
+                                 chatter_tokens=args.chatter_tokens, answer=answer,
+                                 files={f"/files/{os.path.basename(path)}": path
+                                        for path in args.file},
+                                 prefix_slots=args.prefix_slots)
+    print(f"Сервер-заглушка запущен: {server.url}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
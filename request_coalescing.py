@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Объединение одинаковых запросов: повторяющиеся тексты (и, по желанию, шаблонные
+почти-дубликаты вида «куплюайфон14про» / «куплюайфон15про») сегментируются один раз,
+а результат раздаётся всем строкам с таким текстом
+"""
+import re
+import threading
+from collections import Counter, OrderedDict
+from concurrent.futures import Future
+from typing import Dict, List, Tuple
+
+DIGIT_RUN_PATTERN = re.compile(r'[0-9]+')
+
+
+def canonical_form(text: str) -> Tuple[str, List[int]]:
+    """
+    Шаблон текста и начало каждого символа шаблона в исходном тексте.
+    Каждая серия цифр заменяется одним 0, регистр приводится к нижнему
+    (если приведение меняет длину, регистр остаётся как есть)
+    """
+    lowered = text.lower()
+    if len(lowered) != len(text):
+        lowered = text
+    parts, starts = [], []
+    previous = 0
+    for match in DIGIT_RUN_PATTERN.finditer(lowered):
+        parts.append(lowered[previous:match.start()])
+        starts.extend(range(previous, match.start()))
+        parts.append('0')
+        starts.append(match.start())
+        previous = match.end()
+    parts.append(lowered[previous:])
+    starts.extend(range(previous, len(lowered)))
+    return ''.join(parts), starts
+
+
+def canonical_text(text: str) -> str:
+    """Шаблон текста: «куплюайфон7про» и «куплюайфон15про» дают один шаблон"""
+    return canonical_form(text)[0]
+
+
+def map_positions(source: str, positions: List[int], target: str) -> List[int]:
+    """
+    Переносит позиции пробелов с текста source на текст target с тем же шаблоном:
+    позиция перед символом шаблона переходит в начало того же символа в target.
+    Позиции внутри серии цифр (в шаблоне им нет места) отбрасываются
+    """
+    if source == target:
+        return list(positions)
+    source_starts = {start: k for k, start in enumerate(canonical_form(source)[1])}
+    target_starts = canonical_form(target)[1]
+    return [target_starts[source_starts[pos]] for pos in positions if source_starts.get(pos, 0) > 0]
+
+
+class CoalescingDispatcher:
+    """
+    Обёртка над SpaceRestoration с тем же методом restore_spaces_batch.
+    С canonicalize тексты с одним шаблоном (canonical_text) сегментируются один раз,
+    а позиции представителя группы переносятся на каждый текст через map_positions.
+    Если текст с тем же ключом уже обрабатывается в другом потоке, запрос не повторяется,
+    а ждёт готового результата. Недавние результаты хранятся в LRU на memo_size ключей;
+    как и в ResponseCache, запоминаются только полные ответы модели - после сбоя бэкенда
+    текст будет запрошен снова
+    """
+
+    def __init__(self, model, canonicalize: bool = False, memo_size: int = 10000):
+        self.model = model
+        self.canonicalize = canonicalize
+        self.memo_size = memo_size
+        self.stats = Counter()
+        self._in_flight: Dict[str, Future] = {}
+        self._memo = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def metrics(self):
+        return getattr(self.model, 'metrics', None)
+
+    def key(self, text: str) -> str:
+        return canonical_text(text) if self.canonicalize else text
+
+    def restore_spaces_batch(self, texts: List[str]) -> List[List[int]]:
+        keys = [self.key(text) for text in texts]
+        results = {}
+        futures = {}
+        owned = {}
+        with self._lock:
+            for key, text in zip(keys, texts):
+                if key in results or key in futures or key in owned:
+                    self.stats['duplicates'] += 1
+                elif key in self._memo:
+                    self._memo.move_to_end(key)
+                    results[key] = self._memo[key]
+                    self.stats['memo_hits'] += 1
+                elif key in self._in_flight:
+                    futures[key] = self._in_flight[key]
+                    self.stats['coalesced'] += 1
+                else:
+                    # Этот поток отвечает за ключ; представитель группы - первый текст с ним
+                    owned[key] = text
+                    self._in_flight[key] = Future()
+            self.stats['texts'] += len(texts)
+            self.stats['model_texts'] += len(owned)
+
+        # Сначала обрабатываем свои ключи и только потом ждём чужие - так потоки
+        # не могут ждать друг друга по кругу
+        if owned:
+            try:
+                positions, complete = self.restore_owned(list(owned.values()))
+            except BaseException as error:
+                with self._lock:
+                    for key in owned:
+                        self._in_flight.pop(key).set_exception(error)
+                raise
+            with self._lock:
+                for (key, text), key_positions, key_complete in zip(owned.items(), positions,
+                                                                    complete):
+                    # Вместе с позициями хранится текст, к которому они относятся
+                    results[key] = (text, key_positions)
+                    if key_complete:
+                        self._remember(key, results[key])
+                    else:
+                        self.stats['not_memoized'] += 1
+                    self._in_flight.pop(key).set_result(results[key])
+
+        for key, future in futures.items():
+            results[key] = future.result()
+        return [map_positions(*results[key], text) for key, text in zip(keys, texts)]
+
+    def restore_owned(self, texts: List[str]) -> Tuple[List[List[int]], List[bool]]:
+        """Позиции от модели и признаки полного ответа (если модель их не сообщает - все полные)"""
+        checked = getattr(self.model, 'restore_spaces_batch_checked', None)
+        if checked is not None:
+            return checked(texts)
+        return self.model.restore_spaces_batch(texts), [True] * len(texts)
+
+    def _remember(self, key: str, result: Tuple[str, List[int]]):
+        if self.memo_size <= 0:
+            return
+        self._memo[key] = result
+        if len(self._memo) > self.memo_size:
+            self._memo.popitem(last=False)
+
+    @property
+    def dedup_ratio(self) -> float:
+        """Доля текстов, для которых не понадобился отдельный запрос к модели"""
+        if not self.stats['texts']:
+            return 0.0
+        return 1 - self.stats['model_texts'] / self.stats['texts']
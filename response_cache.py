@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Постоянный кэш ответов LLM на диске (SQLite) с вытеснением по LRU
+"""
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+
+
+class ResponseCache:
+    """
+    Кэш ответов модели. Ключ - хэш от (модель, версия промпта, опции генерации, текст),
+    поэтому при смене любой из этих частей старые записи просто перестают находиться.
+    Размер ограничен max_entries: при переполнении удаляются давно не использованные записи.
+    """
+
+    def __init__(self, path: str = ".llm_cache.sqlite", max_entries: int = 1_000_000):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY,"
+            " prompt_version TEXT NOT NULL,"
+            " response TEXT NOT NULL,"
+            " last_access REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)"
+        )
+        self._conn.commit()
+        self._size = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    @staticmethod
+    def make_key(model_name: str, prompt_version: str, options: Dict, text: str) -> str:
+        """Строит ключ кэша из всех параметров, влияющих на ответ модели"""
+        raw = json.dumps([model_name, prompt_version, options, text],
+                         ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """Возвращает сохранённый ответ или None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._conn.execute(
+                "UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key)
+            )
+            self._conn.commit()
+            return row[0]
+
+    def put(self, key: str, response: str, prompt_version: str):
+        """Сохраняет ответ и при необходимости вытесняет старые записи"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT OR IGNORE INTO responses (key, prompt_version, response, last_access)"
+                " VALUES (?, ?, ?, ?)",
+                (key, prompt_version, response, time.time())
+            )
+            if cursor.rowcount:
+                self._size += 1
+            else:
+                self._conn.execute(
+                    "UPDATE responses SET response = ?, last_access = ? WHERE key = ?",
+                    (response, time.time(), key)
+                )
+            if self._size > self.max_entries:
+                self._evict(self._size - self.max_entries)
+            self._conn.commit()
+
+    def _evict(self, count: int):
+        """Удаляет count давно не использованных записей"""
+        self._conn.execute(
+            "DELETE FROM responses WHERE key IN"
+            " (SELECT key FROM responses ORDER BY last_access LIMIT ?)", (count,)
+        )
+        self._size -= count
+
+    def invalidate(self, keep_prompt_version: Optional[str] = None) -> int:
+        """
+        Удаляет записи других версий промпта (или все записи, если версия не указана).
+        Возвращает число удалённых записей.
+        """
+        with self._lock:
+            if keep_prompt_version is None:
+                cursor = self._conn.execute("DELETE FROM responses")
+            else:
+                cursor = self._conn.execute(
+                    "DELETE FROM responses WHERE prompt_version != ?", (keep_prompt_version,)
+                )
+            self._conn.commit()
+            self._size -= cursor.rowcount
+            return cursor.rowcount
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self) -> Dict[str, float]:
+        """Счётчики попаданий и промахов"""
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hit_rate,
+            'entries': self._size,
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
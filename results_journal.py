@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Журнал результатов: каждая готовая строка сразу дописывается на диск,
+чтобы прерванный запуск можно было продолжить с места остановки
+"""
+import json
+import os
+from typing import Iterable, Iterator, List, Tuple
+
+from submission import merge_predictions, read_journal
+
+
+class ResultsJournal:
+    """
+    Append-only файл в формате JSON Lines: {"id": ..., "predicted_positions": [...]}.
+    После каждой записи выполняется fsync, поэтому при падении теряется не больше одной строки.
+    Результаты пишутся в порядке датасета, поэтому журнал - это префикс входного файла,
+    и продолжение запуска и сборка CSV выполняются потоково, без загрузки журнала в память.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = None
+
+    def iter_records(self) -> Iterator[Tuple[int, List[int]]]:
+        """Лениво читает сохранённые результаты; оборванная последняя строка пропускается"""
+        if os.path.exists(self.path):
+            yield from read_journal(self.path)
+
+    def count(self) -> int:
+        """Число строк в журнале"""
+        if not os.path.exists(self.path):
+            return 0
+        with open(self.path, 'rb') as f:
+            return sum(1 for line in f if line.endswith(b'\n'))
+
+    def skip_done(self, rows: Iterable[Tuple[int, str]]) -> Iterator[Tuple[int, str]]:
+        """Отдаёт строки датасета, которых ещё нет в журнале"""
+        for row_id, text, positions in merge_predictions(rows, self.iter_records()):
+            if positions is None:
+                yield row_id, text
+
+    def open(self, resume: bool = False):
+        """Открывает журнал на запись; без resume начинает его заново"""
+        if resume and os.path.exists(self.path):
+            self._truncate_partial_tail()
+            self._file = open(self.path, 'a', encoding='utf-8')
+        else:
+            self._file = open(self.path, 'w', encoding='utf-8')
+        return self
+
+    def _truncate_partial_tail(self):
+        """Обрезает недописанную при падении последнюю строку"""
+        with open(self.path, 'rb+') as f:
+            data = f.read()
+            if data and not data.endswith(b'\n'):
+                f.truncate(data.rfind(b'\n') + 1)
+
+    def append(self, row_id: int, positions: List[int]):
+        """Дописывает результат и сбрасывает его на диск"""
+        record = {'id': int(row_id), 'predicted_positions': [int(pos) for pos in positions]}
+        self._file.write(json.dumps(record) + '\n')
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+"""
+HTTP-сервис сегментации на asyncio: POST /segment принимает один текст или список,
+одновременные запросы собираются в микропакеты и уходят в модель вместе.
+Очередь ограничена: когда она заполнена, сервис сразу отвечает 503
+"""
+import asyncio
+import json
+import logging
+import signal
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+
+from viterbi_segmenter import insert_spaces
+
+logger = logging.getLogger('space_restoration')
+
+DEFAULT_MAX_WAIT = 0.01
+DEFAULT_MAX_QUEUE = 1024
+# Максимальный размер тела запроса, байт
+MAX_BODY_SIZE = 16 << 20
+
+
+class QueueFullError(Exception):
+    """Очередь запросов заполнена"""
+
+
+class RequestTooLargeError(Exception):
+    """В запросе больше текстов, чем помещается в очередь целиком"""
+
+
+class MicroBatcher:
+    """
+    Собирает тексты из очереди в пакеты до max_batch_size штук, ожидая добора пакета
+    не дольше max_wait секунд после первого текста. Пакеты обрабатываются в пуле потоков,
+    одновременно не больше max_in_flight
+    """
+
+    def __init__(self, model, max_batch_size: int = 16, max_wait: float = DEFAULT_MAX_WAIT,
+                 max_queue: int = DEFAULT_MAX_QUEUE, max_in_flight: int = 4):
+        self.model = model
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait
+        self.max_in_flight = max(1, max_in_flight)
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        self.stats = Counter()
+        self._executor = ThreadPoolExecutor(max_workers=self.max_in_flight)
+        self._slots = asyncio.Semaphore(self.max_in_flight)
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._executor.shutdown(wait=True)
+
+    def submit_many(self, texts: List[str]) -> List[asyncio.Future]:
+        """Ставит тексты в очередь; при нехватке места не ставит ни одного"""
+        if self.queue.maxsize and len(texts) > self.queue.maxsize:
+            self.stats['rejected'] += len(texts)
+            raise RequestTooLargeError(f"В запросе {len(texts)} текстов, а очередь вмещает "
+                                       f"{self.queue.maxsize}: разбейте запрос на части")
+        if self.queue.maxsize and self.queue.qsize() + len(texts) > self.queue.maxsize:
+            self.stats['rejected'] += len(texts)
+            raise QueueFullError(f"Очередь заполнена ({self.queue.qsize()}/{self.queue.maxsize})")
+        loop = asyncio.get_running_loop()
+        futures = []
+        for text in texts:
+            future = loop.create_future()
+            self.queue.put_nowait((text, future, time.perf_counter()))
+            futures.append(future)
+        self.stats['texts'] += len(texts)
+        return futures
+
+    async def next_batch(self) -> List[Tuple[str, asyncio.Future, float]]:
+        batch = [await self.queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            try:
+                batch.append(self.queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            # Не wait_for: при отмене по таймауту он может потерять уже взятый из очереди текст
+            getter = asyncio.ensure_future(self.queue.get())
+            done, _ = await asyncio.wait({getter}, timeout=timeout)
+            if getter not in done:
+                getter.cancel()
+                break
+            batch.append(getter.result())
+        return batch
+
+    async def run(self):
+        while True:
+            await self._slots.acquire()
+            batch = await self.next_batch()
+            asyncio.get_running_loop().create_task(self.process(batch))
+
+    async def process(self, batch):
+        try:
+            # Клиент мог отключиться, пока текст ждал в очереди
+            batch = [item for item in batch if not item[1].done()]
+            if not batch:
+                return
+            texts = [text for text, _, _ in batch]
+            self.stats['batches'] += 1
+            self.stats['batched_texts'] += len(texts)
+            self.stats['queue_wait'] += sum(time.perf_counter() - queued for _, _, queued in batch)
+            try:
+                results = await asyncio.get_running_loop().run_in_executor(
+                    self._executor, self.model.restore_spaces_batch, texts)
+            except Exception as error:
+                logger.warning("Ошибка обработки пакета: %s", error)
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(error)
+                return
+            for (_, future, _), positions in zip(batch, results):
+                if not future.done():
+                    future.set_result(positions)
+        finally:
+            self._slots.release()
+
+    def summary(self) -> str:
+        batches = self.stats['batches']
+        return (f"Текстов: {self.stats['texts']}, пакетов: {batches}, "
+                f"средний размер пакета: {self.stats['batched_texts'] / max(batches, 1):.1f}, "
+                f"среднее ожидание в очереди: "
+                f"{self.stats['queue_wait'] / max(self.stats['batched_texts'], 1) * 1000:.1f} мс, "
+                f"отклонено: {self.stats['rejected']}")
+
+
+class SegmentationService:
+    """
+    Минимальный HTTP/1.1-сервер поверх asyncio.start_server (с keep-alive):
+    POST /segment {"text": "..."} или {"texts": [...]}, GET /health, GET /metrics
+    """
+
+    def __init__(self, batcher: MicroBatcher, metrics=None):
+        self.batcher = batcher
+        self.metrics = metrics
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode('latin-1').split(' ', 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get('content-length') or 0)
+                if length > MAX_BODY_SIZE:
+                    await self.respond(writer, 413, {'error': 'тело запроса слишком большое'})
+                    break
+                body = await reader.readexactly(length) if length else b''
+                status, payload = await self.route(method, path.split('?', 1)[0], body)
+                await self.respond(writer, status, payload)
+                if headers.get('connection', '').lower() == 'close':
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def route(self, method: str, path: str, body: bytes):
+        if method == 'GET' and path == '/health':
+            return 200, {'status': 'ok', 'queue': self.batcher.queue.qsize()}
+        if method == 'GET' and path == '/metrics' and self.metrics is not None:
+            return 200, self.metrics.prometheus_text()
+        if method != 'POST' or path != '/segment':
+            return 404, {'error': 'not found'}
+        try:
+            request = json.loads(body or b'{}')
+        except ValueError:
+            return 400, {'error': 'тело запроса должно быть JSON'}
+        if not isinstance(request, dict):
+            return 400, {'error': 'ожидается JSON-объект'}
+        single = 'text' in request
+        texts = [request['text']] if single else request.get('texts')
+        if not isinstance(texts, list) or not all(isinstance(text, str) for text in texts):
+            return 400, {'error': 'ожидается {"text": "..."} или {"texts": ["...", ...]}'}
+
+        try:
+            futures = self.batcher.submit_many(texts)
+        except QueueFullError as error:
+            return 503, {'error': str(error)}
+        except RequestTooLargeError as error:
+            # Повтор не поможет, поэтому не 503 с Retry-After
+            return 413, {'error': str(error)}
+        try:
+            results = await asyncio.gather(*futures)
+        except Exception as error:
+            return 502, {'error': f"ошибка модели: {error}"}
+        items = [{'positions': positions, 'text': insert_spaces(text, positions)}
+                 for text, positions in zip(texts, results)]
+        return 200, items[0] if single else {'results': items}
+
+    async def respond(self, writer: asyncio.StreamWriter, status: int, payload):
+        reasons = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 413: 'Payload Too Large',
+                   502: 'Bad Gateway', 503: 'Service Unavailable'}
+        if isinstance(payload, str):
+            body, content_type = payload.encode('utf-8'), 'text/plain; version=0.0.4'
+        else:
+            body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+            content_type = 'application/json'
+        head = (f"HTTP/1.1 {status} {reasons.get(status, '')}\r\n"
+                f"Content-Type: {content_type}\r\nContent-Length: {len(body)}\r\n")
+        if status == 503:
+            head += "Retry-After: 1\r\n"
+        writer.write(head.encode('latin-1') + b"\r\n" + body)
+        await writer.drain()
+
+
+async def serve(model, host: str = '0.0.0.0', port: int = 8080, max_batch_size: int = 16,
+                max_wait: float = DEFAULT_MAX_WAIT, max_queue: int = DEFAULT_MAX_QUEUE,
+                max_in_flight: int = 4, metrics=None, ready: Optional[asyncio.Event] = None):
+    """Запускает сервис и обслуживает запросы до отмены"""
+    batcher = MicroBatcher(model, max_batch_size, max_wait, max_queue, max_in_flight)
+    service = SegmentationService(batcher, metrics)
+    batcher.start()
+    server = await asyncio.start_server(service.handle_connection, host, port)
+    address = server.sockets[0].getsockname()
+    print(f"Сервис сегментации запущен: http://{address[0]}:{address[1]}/segment "
+          f"(пакет до {batcher.max_batch_size}, ожидание {max_wait * 1000:.0f} мс, "
+          f"очередь {max_queue})")
+    if ready is not None:
+        ready.set()
+    # SIGTERM (docker stop) завершает сервис так же, как Ctrl-C
+    try:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+    except (NotImplementedError, RuntimeError):
+        pass
+    try:
+        async with server:
+            await server.serve_forever()
+    except asyncio.CancelledError:
+        pass
+    finally:
+        await batcher.stop()
+        print(batcher.summary())
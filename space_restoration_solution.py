@@ -3,100 +3,382 @@
 Решение для восстановления пропущенных пробелов в тексте
 Использует только LLM для обработки
 """
-import pandas as pd
-import requests
-import os
 import time
-from typing import List
+
+# Момент запуска берётся до остальных импортов, чтобы холодный старт включал их загрузку
+STARTUP_TIME = time.perf_counter()
+
+import argparse
+import logging
+import math
+import os
+import re
+import threading
+import uuid
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Iterator, List, Optional, Tuple
 import json
 
+from backends import (BACKENDS, DEFAULT_GGUF_PATH, DEFAULT_OLLAMA_MODEL, THINK_PATTERN,
+                      BackendError, EndpointPool, InferenceBackend, OllamaBackend,
+                      create_backend, parse_keep_alive)
+from dataset_io import DatasetReader, count_records
+from metrics import MetricsRecorder
+from request_coalescing import CoalescingDispatcher
+from response_cache import ResponseCache
+from results_journal import ResultsJournal
+from submission import SUBMISSION_FORMATS, SubmissionBuilder, build_submission, parse_output
+from viterbi_segmenter import ViterbiSegmenter, insert_spaces
+
+logger = logging.getLogger('space_restoration')
+
+# Максимальное число одновременных запросов к LLM по умолчанию
+DEFAULT_MAX_IN_FLIGHT = int(os.getenv('MAX_IN_FLIGHT', '4'))
+
+# Версия шаблона промпта: менять при любом изменении PROMPT_PREFIX или build_prompt,
+# чтобы кэш ответов не отдавал результаты старого промпта
+PROMPT_VERSION = "2"
+
+# Статическая часть промпта: постановка задачи и примеры. Она не зависит от входа и уходит
+# системным сообщением, поэтому во всех запросах побайтно одинакова и сервер переиспользует
+# её префилл (KV-кэш префикса в Ollama, vLLM и llama.cpp). Отступов нет - они только
+# добавляли токены
+PROMPT_PREFIX = (
+    "<task>Задача: найти позиции, где нужно вставить пробелы в тексте без пробелов "
+    "(задача word segmentation). Требуется вернуть только ответ, а именно числа, "
+    "перечисленные через запятую в квадратных скобках.</task>\n"
+    "<note>ВАЖНО: Отвечай только списком чисел в квадратных скобках. Никаких объяснений, "
+    "рассуждений или дополнительного текста.</note>\n"
+    "<examples>\n"
+    "<text>куплюайфон17max</text>\n<answer>[5, 11, 13]</answer>\n"
+    "<text>ищудомвПодмосковье</text>\n<answer>[3, 6, 7]</answer>\n"
+    "<text>сдаюквартирусмебельюитехникой</text>\n<answer>[4, 12, 13, 21, 22]</answer>\n"
+    "</examples>\n"
+)
+
+# Формат ответа для нескольких текстов в одном промпте. Стоит после префикса,
+# чтобы префикс оставался общим для одиночных и упакованных запросов
+PACKED_PROMPT_NOTE = ('<note>Во входе несколько текстов с номерами. Для каждого текста выведи '
+                      'отдельную строку вида "номер: [позиции]", например "1: [3, 6, 7]".</note>\n')
+
+# Минимальная уверенность словарного сегментатора, при которой LLM не вызывается
+DEFAULT_HYBRID_THRESHOLD = 0.95
+
+# Перекрытие соседних окон при сегментации длинных текстов, символов
+DEFAULT_WINDOW_OVERLAP = 16
+
+# Шаблоны разбора ответа компилируются один раз при импорте
+ANSWER_LIST_PATTERN = re.compile(r'\[(\d+(?:,\s*\d+)*|)\]')
+POSITIONS_PATTERN = re.compile(r'\[([0-9,\s]*)\]')
+PACKED_LINE_PATTERN = re.compile(r'^\s*(\d+)\s*[:.)]\s*(\[[0-9,\s]*\])', flags=re.MULTILINE)
+
+# Непрерывные участки кириллицы, латиницы и цифр. На стыке соседних участков разных классов
+# пробел ставится без LLM: куплюайфон17max -> куплюайфон|17|max
+CLASS_RUN_PATTERN = re.compile(r'[а-яёА-ЯЁ]+|[a-zA-Z]+|[0-9]+')
+# Участки без букв (только цифры и знаки) в LLM не отправляются
+LETTER_PATTERN = re.compile(r'[а-яёА-ЯЁa-zA-Z]')
+
+
+def class_boundaries(text: str) -> List[int]:
+    """Позиции на стыках кириллицы, латиницы и цифр, идущих вплотную друг к другу"""
+    boundaries = []
+    previous_end = None
+    for match in CLASS_RUN_PATTERN.finditer(text):
+        if match.start() == previous_end:
+            boundaries.append(match.start())
+        previous_end = match.end()
+    return boundaries
+
+
+def split_by_boundaries(text: str, boundaries: List[int]) -> List[Tuple[int, str]]:
+    """Делит текст по позициям на участки (смещение, участок)"""
+    edges = [0] + boundaries + [len(text)]
+    return [(start, text[start:end]) for start, end in zip(edges, edges[1:])]
+
+
+# Максимальная доля позиций текста, перед которыми может стоять пробел
+DEFAULT_MAX_SPACE_RATIO = 0.5
+
+
+def max_spaces(length: int, max_space_ratio: float = DEFAULT_MAX_SPACE_RATIO) -> int:
+    """Верхняя оценка числа пробелов в тексте длины length"""
+    return max(0, min(length - 1, math.ceil(length * max_space_ratio)))
+
+
+def position_token_budget(length: int, max_space_ratio: float = DEFAULT_MAX_SPACE_RATIO,
+                          slack: int = 4) -> int:
+    """
+    Бюджет токенов на ответ: скобки плюс для каждого пробела число
+    (до одной цифры на токен) и разделитель ", "
+    """
+    digits = len(str(max(1, length - 1)))
+    return 2 + max_spaces(length, max_space_ratio) * (digits + 2) + slack
+
+
+def position_list_schema(length: int, max_space_ratio: float = DEFAULT_MAX_SPACE_RATIO) -> dict:
+    """JSON-схема ответа: массив целых позиций внутри текста без повторов"""
+    return {
+        "type": "array",
+        "items": {"type": "integer", "minimum": 1, "maximum": max(1, length - 1)},
+        "uniqueItems": True,
+        "maxItems": max_spaces(length, max_space_ratio),
+    }
+
 
 class SpaceRestoration:
-    def __init__(self, ollama_url: str = "http://localhost:11434"):
+    def __init__(self, ollama_url: str = "http://localhost:11434",
+                 backend: Optional[InferenceBackend] = None,
+                 cache: Optional[ResponseCache] = None,
+                 segmenter: Optional[ViterbiSegmenter] = None,
+                 hybrid_threshold: float = DEFAULT_HYBRID_THRESHOLD,
+                 pack_size: int = 1,
+                 token_budget: bool = False,
+                 json_schema: bool = False,
+                 max_space_ratio: float = DEFAULT_MAX_SPACE_RATIO,
+                 metrics: Optional[MetricsRecorder] = None,
+                 window_size: int = 0,
+                 window_overlap: int = DEFAULT_WINDOW_OVERLAP,
+                 class_split: bool = False,
+                 prefix_reuse: bool = True):
         self.ollama_url = ollama_url
-        self.model_name = "hf.co/Vikhrmodels/QVikhr-3-1.7B-Instruction-noreasoning-GGUF:Q4_K_M"
+        self.backend = backend or OllamaBackend(ollama_url)
+        self.cache = cache
+        # Гибридный режим: словарный сегментатор, а LLM только для неуверенных текстов
+        self.segmenter = segmenter
+        self.hybrid_threshold = hybrid_threshold
+        self.routing_stats = Counter()
+        # Сколько текстов упаковывать в один промпт (1 - без упаковки)
+        self.pack_size = max(1, pack_size)
+        self.token_stats = Counter()
+        # Бюджет генерации по длине текста и ограничение ответа JSON-схемой
+        self.token_budget = token_budget
+        self.json_schema = json_schema
+        self.max_space_ratio = max_space_ratio
+        self.metrics = metrics
+        # Длинные тексты (длиннее window_size символов) сегментируются по окнам
+        if window_size and not 0 <= window_overlap < window_size:
+            raise ValueError("window_overlap должен быть меньше window_size")
+        self.window_size = window_size
+        self.window_overlap = window_overlap
+        # Стыки классов символов ставятся сразу, а в LLM уходят только однородные участки
+        self.class_split = class_split
+        # Общий префикс промпта уходит системным сообщением и кэшируется сервером.
+        # Без prefix_reuse он встраивается в каждый промпт после уникальной метки,
+        # так что префилл всегда считается заново (для замеров)
+        self.prefix_reuse = prefix_reuse
+        self._stats_lock = threading.Lock()
+        self.model_name = self.backend.model_name or DEFAULT_OLLAMA_MODEL
+        self.options = {
+            "temperature": 0.0,
+            "top_p": 0.1,
+            "num_predict": 200,
+            "repeat_penalty": 1.0
+        }
+        if prefix_reuse:
+            self.options["system"] = PROMPT_PREFIX
+
+    def wrap_prompt(self, body: str) -> str:
+        """Переменная часть промпта; без prefix_reuse - вместе с префиксом после уникальной метки"""
+        if self.prefix_reuse:
+            return body
+        return f'<request id="{uuid.uuid4().hex}"/>\n{PROMPT_PREFIX}{body}'
+
+    def build_prompt(self, text: str) -> str:
+        """Строит промпт для одного текста (инструкции и примеры - в PROMPT_PREFIX)"""
+        return self.wrap_prompt(f"<input>\n<text>{text}</text>\n</input>")
+
+    def options_for(self, texts: List[str]) -> dict:
+        """
+        Опции генерации для запроса с текстами texts. Бюджет и схема считаются
+        по самому длинному тексту, так как в пакете опции общие
+        """
+        if not (self.token_budget or self.json_schema):
+            return self.options
+        length = max(len(text) for text in texts)
+        options = dict(self.options)
+        if self.token_budget:
+            options['num_predict'] = min(self.options['num_predict'],
+                                         position_token_budget(length, self.max_space_ratio))
+        if self.json_schema:
+            options['format'] = position_list_schema(length, self.max_space_ratio)
+        return options
+
+    def extract_answer(self, content: str) -> str:
+        """Убирает рассуждения модели и оставляет список чисел в квадратных скобках"""
+        content = THINK_PATTERN.sub('', content.strip()).strip()
+        if content.startswith('['):
+            # Ответ по JSON-схеме может содержать переносы строк
+            try:
+                positions = json.loads(content)
+                if isinstance(positions, list) and all(isinstance(pos, int) for pos in positions):
+                    return str(sorted(set(positions)))
+            except ValueError:
+                pass
+        match = ANSWER_LIST_PATTERN.search(content)
+        if match:
+            return match.group(0)
+        return content
+
+    def cache_key(self, text: str) -> str:
+        """
+        Ключ кэша ответа для текста. При pack_size > 1 ответы получены другим шаблоном
+        и бюджетом генерации, поэтому размер упаковки входит в ключ
+        """
+        options = dict(self.options, token_budget=self.token_budget, json_schema=self.json_schema,
+                       max_space_ratio=self.max_space_ratio, prefix_reuse=self.prefix_reuse,
+                       pack_size=self.pack_size)
+        return ResponseCache.make_key(self.model_name, PROMPT_VERSION, options, text)
 
     def query_llm(self, text: str) -> str:
-        """Запрос к LLM через Ollama API для получения позиций пробелов"""
-        try:
-            prompt = f"""<task>Задача: найти позиции где нужно вставить пробелы в тексте без пробелов (задача word segmentation). 
-            Тебуется вернуть только ответ, а именно числа, перечисленные через запятую в квадратных скобках. </task>
-
-            <note> ВАЖНО: Отвечай только списком чисел в квадратных скобках. Никаких объяснений, рассуждений или дополнительного текста.</note>
-            <examples>
-                <text>
-                куплюайфон17max
-                </text>
-                <answer>
-                [5, 11, 13]
-                </answer>
-                <text>
-                ищудомвПодмосковье
-                </text>
-                <answer>
-                [3, 6, 7]
-                </answer>
-                <text>
-                сдаюквартирусмебельюитехникой
-                </text>
-                <answer>
-                [4, 12, 13, 21, 22]
-                </answer>
-            </examples>
-            <input>
-                <text>
-                {text}
-                </text>
-            </input>
-            """
-
-            payload = {
-                "model": self.model_name,
-                "prompt": prompt,
-                "stream": False,
-                "options": {
-                    "temperature": 0.0,
-                    "top_p": 0.1,
-                    "num_predict": 200,
-                    "repeat_penalty": 1.0
-                }
-            }
-
-            response = requests.post(
-                f"{self.ollama_url}/api/generate",
-                json=payload,
-                timeout=60
-            )
+        """Запрос к LLM через бэкенд инференса для получения позиций пробелов"""
+        return self.query_llm_batch([text])[0]
 
-            if response.status_code == 200:
-                
-                result = response.json()
-                content = result['response'].strip()
-
-                # Ищем список чисел в квадратных скобках с помощью регулярки
-                import re
-                content = re.sub(r'<think>.*?</think>', '', content, flags=re.DOTALL).strip()
-                match = re.search(r'\[(\d+(?:,\s*\d+)*|)\]', content)
-                if match:
-                    return match.group(0)
-                return content
-            else:
-                print(f"Ollama API error: {response.status_code}, {response.text}")
-                return ""
+    def build_packed_prompt(self, texts: List[str]) -> str:
+        """Строит промпт с несколькими пронумерованными текстами в одном блоке <input>"""
+        items = ''.join(f'<text id="{number}">{text}</text>\n'
+                        for number, text in enumerate(texts, 1))
+        return self.wrap_prompt(f"{PACKED_PROMPT_NOTE}<input>\n{items}</input>")
 
+    def parse_packed_response(self, response: str, count: int) -> Optional[List[List[int]]]:
+        """
+        Разбирает ответ на упакованный промпт: по строке "номер: [позиции]" на текст.
+        Возвращает None, если номера не совпадают с 1..count
+        """
+        response = THINK_PATTERN.sub('', response)
+        answers = {}
+        for match in PACKED_LINE_PATTERN.finditer(response):
+            number = int(match.group(1))
+            if number in answers:
+                return None
+            answers[number] = self.parse_positions_from_llm_response(match.group(2))
+        if set(answers) != set(range(1, count + 1)):
+            return None
+        return [answers[number] for number in range(1, count + 1)]
+
+    def generate(self, prompts: List[str], options: dict, items_per_prompt: List[int]):
+        """Вызывает бэкенд и учитывает потраченные токены; при ошибке возвращает None"""
+        # Потоковый бэкенд остановит генерацию, когда в ответе на промпт закроются
+        # все его списки - у каждого промпта пакета их столько, сколько в нём текстов
+        try:
+            if len(prompts) == 1:
+                generations = [self.backend.generate(prompts[0], options, items_per_prompt[0])]
+            else:
+                generations = self.backend.generate_batch(prompts, options, items_per_prompt)
         except Exception as e:
-            print(f"Error querying LLM: {e}")
-            return ""
+            logger.warning("Error querying LLM: %s", e)
+            if self.metrics is not None:
+                for items in items_per_prompt:
+                    self.metrics.record(backend=self.backend.name, items=items, error=str(e))
+            return None
+
+        with self._stats_lock:
+            for generation in generations:
+                stats = generation.stats
+                self.token_stats['requests'] += 1
+                self.token_stats['prompt_tokens'] += stats.get('prompt_eval_count', 0)
+                self.token_stats['prompt_eval_duration'] += stats.get('prompt_eval_duration', 0)
+                self.token_stats['prompt_cached_tokens'] += stats.get('prompt_cached_tokens', 0)
+                self.token_stats['completion_tokens'] += stats.get('eval_count', 0)
+                if 'time_to_first_token' in stats:
+                    self.token_stats['streamed'] += 1
+                    self.token_stats['time_to_first_token'] += stats['time_to_first_token']
+                if 'tokens_saved' in stats:
+                    self.token_stats['early_stops'] += 1
+                    self.token_stats['tokens_saved'] += stats['tokens_saved']
+        return generations
+
+    def record_generation(self, generation, items: int, parse_failures: int = 0, retries: int = 0):
+        """Сохраняет метрики одного запроса к бэкенду"""
+        if self.metrics is None:
+            return
+        fields = {key: value for key, value in generation.stats.items()}
+        self.metrics.record(backend=self.backend.name, items=items,
+                            parse_failures=parse_failures, retries=retries, **fields)
+
+    def query_llm_batch(self, texts: List[str]) -> List[str]:
+        """
+        Пакетный запрос к LLM: все тексты, которых нет в кэше,
+        отправляются бэкенду одним вызовом generate_batch.
+        При pack_size > 1 в один промпт упаковывается до pack_size текстов;
+        если ответ на упакованный промпт не разобрался, тексты запрашиваются по одному
+        """
+        results = [None] * len(texts)
+        keys = [None] * len(texts)
+        if self.cache is not None:
+            for i, text in enumerate(texts):
+                keys[i] = self.cache_key(text)
+                results[i] = self.cache.get(keys[i])
+
+        missing = [i for i, result in enumerate(results) if result is None]
+        if self.cache is not None and self.metrics is not None:
+            self.metrics.increment('cache_hits', len(texts) - len(missing))
+            self.metrics.increment('cache_misses', len(missing))
+        single = missing
+        if self.pack_size > 1 and len(missing) > 1:
+            packs = [missing[k:k + self.pack_size] for k in range(0, len(missing), self.pack_size)]
+            # Оставшийся один текст упаковывать незачем: он уходит обычным промптом
+            single = packs.pop() if len(packs[-1]) == 1 else []
+            # Бюджет генерации растёт вместе с числом текстов в промпте.
+            # Ответ на упакованный промпт - не один массив, поэтому JSON-схема не передаётся
+            options = dict(self.options, num_predict=self.options['num_predict'] * self.pack_size)
+            if self.token_budget:
+                # На каждый текст: номер, двоеточие и перевод строки плюс сам список
+                length = max(len(texts[i]) for pack in packs for i in pack)
+                options['num_predict'] = self.pack_size * (
+                    position_token_budget(length, self.max_space_ratio) + 4)
+            generations = self.generate(
+                [self.build_packed_prompt([texts[i] for i in pack]) for pack in packs],
+                options, [len(pack) for pack in packs]
+            )
+            fallbacks = []
+            for n, pack in enumerate(packs):
+                parsed = None
+                if generations is not None:
+                    parsed = self.parse_packed_response(generations[n].text, len(pack))
+                    # Неразобранный пакет перезапрашивается по одному тексту
+                    self.record_generation(generations[n], len(pack),
+                                           parse_failures=int(parsed is None),
+                                           retries=len(pack) if parsed is None else 0)
+                if parsed is None:
+                    fallbacks.extend(pack)
+                    continue
+                for i, positions in zip(pack, parsed):
+                    results[i] = str(positions)
+            single = fallbacks + single
+            with self._stats_lock:
+                self.token_stats['packed_items'] += len(missing) - len(single)
+                self.token_stats['pack_fallbacks'] += len(fallbacks)
+
+        if single:
+            generations = self.generate([self.build_prompt(texts[i]) for i in single],
+                                        self.options_for([texts[i] for i in single]),
+                                        [1] * len(single))
+            for n, i in enumerate(single):
+                if generations is None:
+                    results[i] = ""
+                    continue
+                results[i] = self.extract_answer(generations[n].text)
+                self.record_generation(generations[n], 1,
+                                       parse_failures=int(not results[i].startswith('[')))
+
+        with self._stats_lock:
+            self.token_stats['items'] += len(missing)
+
+        # Кэшируем только ответы, в которых нашёлся список позиций
+        if self.cache is not None:
+            for i in missing:
+                if results[i].startswith('['):
+                    self.cache.put(keys[i], results[i], PROMPT_VERSION)
+        return results
 
     def parse_positions_from_llm_response(self, response: str) -> List[int]:
         """Парсит список позиций из ответа LLM"""
         try:
-            import re
-
             # Ищем список в квадратных скобках
-            match = re.search(r'\[([0-9,\s]*)\]', response)
+            match = POSITIONS_PATTERN.search(response)
             if not match:
-                print(f"Не найден список в ответе: {response}")
+                logger.debug("Не найден список в ответе: %s", response)
                 return []
 
             # Извлекаем числа
@@ -117,22 +399,150 @@ class SpaceRestoration:
             return sorted(positions)
 
         except Exception as e:
-            print(f"Ошибка парсинга позиций: {e}")
+            logger.warning("Ошибка парсинга позиций: %s", e)
             return []
 
+    def warm_up(self) -> float:
+        """
+        Загружает модель и прогревает общий префикс промпта до начала замеров,
+        чтобы первый настоящий запрос не платил за загрузку. Возвращает время прогрева
+        """
+        start = time.perf_counter()
+        self.backend.warm_up(self.build_prompt(''), self.options)
+        return time.perf_counter() - start
+
     def restore_spaces(self, text: str) -> List[int]:
         """
         Основной метод восстановления пробелов через LLM
         """
-        if not text:
-            return []
+        return self.restore_spaces_batch([text])[0]
+
+    def restore_spaces_batch(self, texts: List[str]) -> List[List[int]]:
+        """
+        Восстановление пробелов для пакета текстов за один вызов бэкенда.
+        В гибридном режиме в LLM уходят только тексты, в которых не уверен словарный сегментатор
+        """
+        return self.restore_spaces_batch_checked(texts)[0]
 
-        # Получаем результат от LLM
-        llm_result = self.query_llm(text)
+    def restore_spaces_batch_checked(self, texts: List[str]) -> Tuple[List[List[int]], List[bool]]:
+        """
+        То же, что restore_spaces_batch, но вместе с позициями возвращает для каждого текста
+        признак полного ответа: False - LLM не ответил или ответ не разобрался хотя бы
+        для одного участка текста, и позиции могут быть неполными
+        """
+        results = [[] for _ in texts]
+        complete = [True] * len(texts)
+        pending = []
+        for i, text in enumerate(texts):
+            if not text:
+                continue
+            if self.segmenter is not None:
+                positions, confidence = self.segmenter.segment(text)
+                if confidence >= self.hybrid_threshold:
+                    results[i] = positions
+                    continue
+            pending.append(i)
+
+        with self._stats_lock:
+            self.routing_stats['segmenter'] += len(texts) - len(pending)
+            self.routing_stats['llm'] += len(pending)
+        if not pending:
+            return results, complete
+
+        # Тексты делятся на участки: при class_split - по стыкам классов символов,
+        # иначе участок один - весь текст
+        spans = {}
+        for i in pending:
+            text = texts[i]
+            if not self.class_split:
+                spans[i] = [(0, text)]
+                continue
+            boundaries = class_boundaries(text)
+            results[i] = boundaries
+            spans[i] = [(offset, span) for offset, span in split_by_boundaries(text, boundaries)
+                        if len(span) > 1 and LETTER_PATTERN.search(span)]
+            with self._stats_lock:
+                self.routing_stats['class_positions'] += len(boundaries)
+                self.routing_stats['chars'] += len(text)
+                self.routing_stats['llm_chars'] += sum(len(span) for _, span in spans[i])
+
+        # Длинные участки режутся на перекрывающиеся окна, которые уходят в LLM
+        # вместе с короткими одним пакетом и обрабатываются параллельно
+        llm_texts, owners = [], []
+        for i in pending:
+            for offset, span in spans[i]:
+                if self.window_size and len(span) > self.window_size:
+                    for start in self.window_starts(len(span)):
+                        llm_texts.append(span[start:start + self.window_size])
+                        owners.append((i, offset, span, start))
+                else:
+                    llm_texts.append(span)
+                    owners.append((i, offset, span, None))
+
+        # Позиции участков переводятся в координаты исходного текста
+        windows = {}
+        span_positions = {i: [] for i in pending}
+        llm_results = self.query_llm_batch(llm_texts) if llm_texts else []
+        for (i, offset, span, start), llm_result in zip(owners, llm_results):
+            if not llm_result.startswith('['):
+                complete[i] = False
+            if start is None:
+                positions = self.positions_from_result(span, llm_result)
+                span_positions[i].extend(offset + pos for pos in positions)
+            else:
+                windows.setdefault((i, offset, span), []).append((start, llm_result))
+        for (i, offset, span), window_results in windows.items():
+            positions = self.merge_windows(span, window_results)
+            span_positions[i].extend(offset + pos for pos in positions)
+
+        for i in pending:
+            if self.class_split:
+                results[i] = sorted(set(results[i]) | set(span_positions[i]))
+            else:
+                results[i] = span_positions[i]
+        return results, complete
+
+    def window_starts(self, length: int) -> List[int]:
+        """Начала окон длины window_size с перекрытием window_overlap, покрывающих весь текст"""
+        step = self.window_size - self.window_overlap
+        starts = [0]
+        while starts[-1] + self.window_size < length:
+            starts.append(starts[-1] + step)
+        return starts
+
+    def merge_windows(self, text: str, window_results: List[Tuple[int, str]]) -> List[int]:
+        """
+        Переводит позиции из окон в позиции исходного текста. Каждая область перекрытия
+        делится пополам: позиции в ней берутся из того окна, для которого они дальше от края,
+        так как у модели там больше контекста с обеих сторон
+        """
+        window_results = sorted(window_results)
+        starts = [start for start, _ in window_results]
+        positions = set()
+        for k, (start, llm_result) in enumerate(window_results):
+            # Границы зоны ответственности окна - середины перекрытий с соседями
+            low = 0 if k == 0 else (start + starts[k - 1] + self.window_size) // 2
+            high = len(text) if k == len(starts) - 1 else (starts[k + 1] + start + self.window_size) // 2
+            if llm_result and not llm_result.startswith('['):
+                with self._stats_lock:
+                    self.token_stats['parse_failures'] += 1
+            for pos in self.parse_positions_from_llm_response(llm_result) if llm_result else []:
+                if low <= start + pos < high:
+                    positions.add(start + pos)
+
+        # Фильтр по границам текста применяется один раз к итоговому списку
+        valid_positions = [pos for pos in sorted(positions) if 0 < pos < len(text)]
+        logger.debug("Текст: %s, окон: %d, позиции: %s", text, len(starts), valid_positions)
+        return valid_positions
 
+    def positions_from_result(self, text: str, llm_result: str) -> List[int]:
+        """Превращает ответ LLM в список допустимых позиций для текста"""
         if not llm_result:
-            print(f"LLM не вернул результат для: {text}")
+            logger.debug("LLM не вернул результат для: %s", text)
             return []
+        if not llm_result.startswith('['):
+            with self._stats_lock:
+                self.token_stats['parse_failures'] += 1
 
         # Парсим позиции из ответа LLM
         positions = self.parse_positions_from_llm_response(llm_result)
@@ -140,10 +550,7 @@ class SpaceRestoration:
         # Фильтруем позиции в пределах текста
         valid_positions = [pos for pos in positions if 0 < pos < len(text)]
 
-        print(f"Текст: {text}")
-        print(f"LLM результат: {llm_result}")
-        print(f"Позиции: {valid_positions}")
-        print("-" * 40)
+        logger.debug("Текст: %s, LLM результат: %s, позиции: %s", text, llm_result, valid_positions)
 
         return valid_positions
 
@@ -169,75 +576,395 @@ class SpaceRestoration:
         return f1
 
 
-def main():
-    """Основная функция обработки датасета"""
+def iter_chunks(rows: Iterable[Tuple[int, str]], size: int) -> Iterator[List[Tuple[int, str]]]:
+    """Разбивает поток строк на пакеты по size штук"""
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def restore_spaces_concurrently(model: SpaceRestoration,
+                                 rows: Iterable[Tuple[int, str]],
+                                 max_in_flight: int = DEFAULT_MAX_IN_FLIGHT,
+                                 batch_size: int = 1
+                                 ) -> Iterator[Tuple[int, str, List[int]]]:
+    """
+    Обрабатывает строки пакетами по batch_size параллельно, держа в работе
+    не более max_in_flight пакетов. Результаты отдаются строго в порядке входных строк.
+    """
+    max_in_flight = max(1, max_in_flight)
+    window = deque()
+
+    def run_batch(texts: List[str], submitted_at: float) -> List[List[int]]:
+        # Время ожидания свободного потока попадает в метрики запросов этого пакета
+        metrics = getattr(model, 'metrics', None)
+        if metrics is not None:
+            metrics.set_queue_wait(time.perf_counter() - submitted_at)
+        return model.restore_spaces_batch(texts)
+
+    def drain_oldest():
+        chunk, future = window.popleft()
+        for (row_id, text), positions in zip(chunk, future.result()):
+            yield row_id, text, positions
+
+    with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+        for chunk in iter_chunks(rows, max(1, batch_size)):
+            # Окно заполнено - ждём самый старый пакет, чтобы сохранить порядок
+            if len(window) >= max_in_flight:
+                yield from drain_oldest()
+            texts = [text for _, text in chunk]
+            window.append((chunk, executor.submit(run_batch, texts, time.perf_counter())))
+
+        while window:
+            yield from drain_oldest()
+
+
+def print_token_stats(token_stats: Counter):
+    """Печатает расход токенов на один текст"""
+    items = token_stats['items']
+    if not items:
+        return
+    print(f"Запросов к LLM: {token_stats['requests']}, текстов: {items}, "
+          f"токенов промпта на текст: {token_stats['prompt_tokens'] / items:.1f}, "
+          f"токенов ответа на текст: {token_stats['completion_tokens'] / items:.1f}")
+    if token_stats['prompt_cached_tokens']:
+        print(f"Токенов промпта из кэша префикса на текст: "
+              f"{token_stats['prompt_cached_tokens'] / items:.1f}")
+    if token_stats['parse_failures']:
+        print(f"Ответов без списка позиций: {token_stats['parse_failures']}")
+    if token_stats['streamed']:
+        print(f"Среднее время до первого токена: "
+              f"{token_stats['time_to_first_token'] / token_stats['streamed']:.3f}с, "
+              f"досрочно остановлено: {token_stats['early_stops']} запросов, "
+              f"сэкономлено до {token_stats['tokens_saved'] / token_stats['requests']:.1f} "
+              f"токенов на запрос")
+    if token_stats['packed_items'] or token_stats['pack_fallbacks']:
+        print(f"Упаковано в общие промпты: {token_stats['packed_items']}, "
+              f"запрошено по одному после ошибки разбора: {token_stats['pack_fallbacks']}")
+
+
+def parse_args(argv=None):
+    """Разбирает аргументы командной строки"""
+    parser = argparse.ArgumentParser(description="Восстановление пробелов в тексте через LLM")
+    parser.add_argument('--dataset', default='dataset_1937770_3.txt',
+                        help="Путь к входному датасету")
+    parser.add_argument('--output', default='submission.csv',
+                        help="Путь к файлу с результатами")
+    parser.add_argument('--output-format', choices=sorted(SUBMISSION_FORMATS), default='full',
+                        help="Формат --output: full - с колонкой text_no_spaces, minimal, "
+                             "quoted или unquoted - только id и позиции")
+    parser.add_argument('--extra-output', action='append', default=[],
+                        help="Дополнительный файл результатов path[:format] (можно несколько раз)")
+    parser.add_argument('--max-in-flight', type=int, default=DEFAULT_MAX_IN_FLIGHT,
+                        help="Максимальное число одновременных запросов к LLM")
+    parser.add_argument('--backend', choices=sorted(BACKENDS), default=os.getenv('LLM_BACKEND', 'ollama'),
+                        help="Сервер инференса: ollama, openai (vLLM) "
+                             "или llamacpp (GGUF в том же процессе)")
+    parser.add_argument('--api-url', default=None,
+                        help="Адрес сервера (по умолчанию OLLAMA_API_URL или VLLM_API_URL), "
+                             "для llamacpp - путь к GGUF (GGUF_MODEL_PATH); "
+                             "несколько адресов через запятую - пул с балансировкой")
+    parser.add_argument('--serve-port', type=int, default=None,
+                        help="Запустить HTTP-сервис сегментации (POST /segment) на этом порту")
+    parser.add_argument('--serve-host', default='0.0.0.0')
+    parser.add_argument('--serve-batch-size', type=int, default=16,
+                        help="Наибольший размер микропакета сервиса, текстов")
+    parser.add_argument('--max-wait-ms', type=float, default=10.0,
+                        help="Сколько сервис ждёт добора микропакета до --serve-batch-size текстов, мс")
+    parser.add_argument('--max-queue', type=int, default=1024,
+                        help="Размер очереди сервиса; при переполнении отвечает 503, "
+                             "на запрос с большим числом текстов - 413")
+    parser.add_argument('--text', default=None,
+                        help="Обработать один текст и вывести результат (без датасета)")
+    parser.add_argument('--no-warm-up', action='store_true',
+                        help="Не прогревать модель перед обработкой")
+    parser.add_argument('--keep-alive', default=os.getenv('OLLAMA_KEEP_ALIVE'),
+                        help="Сколько Ollama держит модель в памяти: 30m, 1h, -1 - всегда")
+    parser.add_argument('--threads', type=int, default=None,
+                        help="Число потоков CPU для бэкенда llamacpp (по умолчанию - все ядра)")
+    parser.add_argument('--health-interval', type=float, default=5.0,
+                        help="Период проверки здоровья серверов пула, с")
+    parser.add_argument('--model-name', default=os.getenv('MODEL_NAME'),
+                        help="Имя модели на сервере (для openai по умолчанию первая из /v1/models)")
+    parser.add_argument('--batch-size', type=int, default=int(os.getenv('BATCH_SIZE', '1')),
+                        help="Число текстов в одном вызове generate_batch")
+    parser.add_argument('--cache', default=os.getenv('LLM_CACHE_PATH', '.llm_cache.sqlite'),
+                        help="Файл кэша ответов LLM")
+    parser.add_argument('--cache-max-entries', type=int, default=1_000_000,
+                        help="Максимальное число записей в кэше (вытеснение по LRU)")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="Не использовать кэш ответов")
+    parser.add_argument('--clear-cache', action='store_true',
+                        help="Очистить кэш перед запуском")
+    parser.add_argument('--journal', default=None,
+                        help="Журнал результатов (по умолчанию <output>.journal.jsonl)")
+    parser.add_argument('--resume', action='store_true',
+                        help="Продолжить прерванный запуск, пропустив id из журнала")
+    parser.add_argument('--no-journal', action='store_true',
+                        help="Писать результаты сразу в выходной CSV без журнала (без --resume)")
+    parser.add_argument('--gold', default=None,
+                        help="CSV с эталонными позициями: после обработки оценить качество")
+    parser.add_argument('--log-level', default=os.getenv('LOG_LEVEL', 'WARNING'),
+                        choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'],
+                        help="Уровень логирования (DEBUG - каждый текст и ответ модели)")
+    parser.add_argument('--progress-interval', type=float, default=10.0,
+                        help="Как часто печатать прогресс, с")
+    parser.add_argument('--trace', default=None,
+                        help="JSONL-файл с метриками каждого запроса к LLM")
+    parser.add_argument('--metrics-file', default=None,
+                        help="Файл с агрегированными метриками в формате Prometheus")
+    parser.add_argument('--metrics-port', type=int, default=None,
+                        help="Порт HTTP-эндпоинта /metrics в формате Prometheus")
+    parser.add_argument('--rejects', default=None,
+                        help="Файл, куда записываются битые строки датасета")
+    parser.add_argument('--dictionary', default=os.getenv('SEGMENTER_DICTIONARY'),
+                        help="Частотный словарь: включает гибридный режим со словарным сегментатором")
+    parser.add_argument('--hybrid-threshold', type=float, default=DEFAULT_HYBRID_THRESHOLD,
+                        help="Уверенность сегментатора, начиная с которой LLM не вызывается")
+    parser.add_argument('--stream', action='store_true',
+                        help="Потоковая генерация Ollama с остановкой после закрытия списка позиций")
+    parser.add_argument('--token-budget', action='store_true',
+                        help="Ограничить num_predict по длине текста вместо фиксированных 200 токенов")
+    parser.add_argument('--json-schema', action='store_true',
+                        help="Ограничить ответ JSON-схемой массива позиций (format в Ollama, guided_json в vLLM)")
+    parser.add_argument('--max-space-ratio', type=float, default=DEFAULT_MAX_SPACE_RATIO,
+                        help="Максимальная доля позиций текста с пробелом для бюджета и схемы")
+    parser.add_argument('--window-size', type=int, default=int(os.getenv('WINDOW_SIZE', '0')),
+                        help="Тексты длиннее стольких символов режутся на окна (0 - не резать)")
+    parser.add_argument('--window-overlap', type=int, default=DEFAULT_WINDOW_OVERLAP,
+                        help="Перекрытие соседних окон, символов")
+    parser.add_argument('--no-coalesce', action='store_true',
+                        help="Не объединять одинаковые тексты в один запрос")
+    parser.add_argument('--canonicalize', action='store_true',
+                        help="Объединять и тексты, отличающиеся только цифрами и регистром")
+    parser.add_argument('--class-split', action='store_true',
+                        help="Ставить пробелы на стыках кириллицы, латиницы и цифр без LLM "
+                             "и отправлять в модель только однородные участки")
+    parser.add_argument('--pack-size', type=int, default=int(os.getenv('PACK_SIZE', '1')),
+                        help="Число текстов в одном промпте (1 - по одному тексту на промпт)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None, startup_time: Optional[float] = None):
+    """
+    Основная функция обработки датасета. startup_time - момент запуска процесса
+    (perf_counter); без него время старта считается от вызова main
+    """
+    if startup_time is None:
+        startup_time = time.perf_counter()
+    args = parse_args(argv)
+    logging.basicConfig(level=args.log_level, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+    if args.no_journal and args.resume:
+        print("--resume требует журнал результатов и несовместим с --no-journal")
+        return
 
     # Инициализация модели
-    ollama_url = os.getenv('OLLAMA_API_URL', 'http://localhost:11434')
-    model = SpaceRestoration(ollama_url)
+    if args.backend == 'ollama':
+        api_url = args.api_url or os.getenv('OLLAMA_API_URL', 'http://localhost:11434')
+    elif args.backend == 'llamacpp':
+        api_url = args.api_url or os.getenv('GGUF_MODEL_PATH', DEFAULT_GGUF_PATH)
+    else:
+        api_url = args.api_url or os.getenv('VLLM_API_URL', 'http://localhost:8000')
+    backend_options = {}
+    if args.stream and args.backend in ('ollama', 'llamacpp'):
+        backend_options['stream'] = True
+    if args.backend == 'llamacpp':
+        backend_options['n_threads'] = args.threads
+    if args.backend == 'ollama':
+        # Общий предел HTTP-запросов к серверу, сколько бы текстов ни было в пакетах
+        backend_options['max_parallel'] = args.max_in_flight
+        if args.keep_alive is not None:
+            backend_options['keep_alive'] = parse_keep_alive(args.keep_alive)
+    try:
+        backend = create_backend(args.backend, api_url, model_name=args.model_name,
+                                 **backend_options)
+    except BackendError as error:
+        print(f"Не удалось создать бэкенд {args.backend}: {error}")
+        return
+    if isinstance(backend, EndpointPool):
+        backend.health_interval = args.health_interval
+        print(f"Пул серверов: {', '.join(b.base_url for b in backend.backends)}")
+    cache = None
+    if not args.no_cache:
+        cache = ResponseCache(args.cache, max_entries=args.cache_max_entries)
+        if args.clear_cache:
+            cache.invalidate()
+        else:
+            # Записи старых версий промпта больше не нужны
+            cache.invalidate(keep_prompt_version=PROMPT_VERSION)
+        print(f"Кэш ответов: {args.cache}, записей: {len(cache)}")
+    segmenter = None
+    if args.dictionary:
+        segmenter = ViterbiSegmenter.from_frequency_file(args.dictionary)
+        print(f"Гибридный режим: словарь {args.dictionary} ({len(segmenter.trie)} слов), "
+              f"порог уверенности {args.hybrid_threshold}")
+    metrics = MetricsRecorder(args.trace)
+    if args.metrics_port:
+        metrics.serve(args.metrics_port)
+    model = SpaceRestoration(api_url, backend=backend, cache=cache, segmenter=segmenter,
+                             hybrid_threshold=args.hybrid_threshold, pack_size=args.pack_size,
+                             token_budget=args.token_budget, json_schema=args.json_schema,
+                             max_space_ratio=args.max_space_ratio, metrics=metrics,
+                             window_size=args.window_size, window_overlap=args.window_overlap,
+                             class_split=args.class_split)
+    # Одинаковые (или шаблонно одинаковые) тексты уходят в модель один раз
+    dispatcher = None if args.no_coalesce else CoalescingDispatcher(model, args.canonicalize)
 
     # Проверяем доступность API
-    try:
-        test_response = requests.get(f"{ollama_url}/api/tags", timeout=10)
-        if test_response.status_code != 200:
-            print(f"Ollama API недоступен по адресу {ollama_url}")
-            print("Убедитесь, что Ollama сервер запущен")
-            return
-    except Exception as e:
-        print(f"Не удается подключиться к Ollama API: {e}")
-        print("Убедитесь, что Ollama сервер запущен")
+    if not backend.health_check():
+        print(f"API {args.backend} недоступен по адресу {api_url}")
+        print("Убедитесь, что сервер инференса запущен")
         return
+    if isinstance(backend, EndpointPool):
+        backend.start_health_checks()
 
-    # Загрузка датасета
-    print("Загружаем датасет...")
-    try:
-        df = pd.read_csv('dataset_1937770_3.txt', sep=',', quoting=3, on_bad_lines='skip')
-        print(f"Загружено {len(df)} записей")
-        print(f"Колонки: {list(df.columns)}")
-        print(f"Первые несколько строк:")
-        print(df.head())
-    except Exception as e:
-        print(f"Ошибка загрузки датасета: {e}")
+    if not args.no_warm_up:
+        try:
+            print(f"Прогрев модели: {model.warm_up():.2f}с")
+        except BackendError as error:
+            print(f"Прогрев не удался: {error}")
+    print(f"Холодный старт: {time.perf_counter() - startup_time:.2f}с")
+
+    if args.serve_port is not None:
+        # Режим сервиса: asyncio и сам сервис нужны только здесь
+        import asyncio
+        from segmentation_service import serve
+        try:
+            asyncio.run(serve(dispatcher or model, args.serve_host, args.serve_port,
+                              max_batch_size=args.serve_batch_size,
+                              max_wait=args.max_wait_ms / 1000, max_queue=args.max_queue,
+                              max_in_flight=args.max_in_flight, metrics=metrics))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if cache is not None:
+                cache.close()
         return
 
+    if args.text is not None:
+        # Один текст без датасета и журнала
+        start = time.perf_counter()
+        positions = model.restore_spaces(args.text)
+        print(f"Позиции: {positions}")
+        print(f"Текст: {insert_spaces(args.text, positions)}")
+        print(f"Задержка: {time.perf_counter() - start:.3f}с")
+        if cache is not None:
+            cache.close()
+        return
+
+    # Датасет читается потоково: строки по одной, битые строки попадают в отчёт
+    reader = DatasetReader(args.dataset, args.rejects)
+    total = count_records(args.dataset)
+
+    # Все форматы результатов пишутся одним проходом с проверкой каждой строки
+    outputs = [(args.output, args.output_format)] + [parse_output(value)
+                                                     for value in args.extra_output]
+    journal = None
+    if args.no_journal:
+        writer = SubmissionBuilder(outputs)
+        rows = iter(reader)
+    else:
+        # Журнал результатов: при --resume пропускаем уже обработанные id
+        journal = ResultsJournal(args.journal or f"{args.output}.journal.jsonl")
+        rows = iter(reader)
+        if args.resume:
+            done = journal.count()
+            if done:
+                print(f"Продолжаем запуск: {done} записей уже есть в журнале {journal.path}")
+            total = max(0, total - done)
+            rows = journal.skip_done(rows)
+        writer = journal.open(resume=args.resume)
+    # Упаковка работает внутри пакета, поэтому пакет не меньше pack_size
+    batch_size = max(args.batch_size, args.pack_size)
+
     # Обработка данных
-    results = []
     processed = 0
 
-    print("Начинаем обработку...")
+    print(f"Начинаем обработку {args.dataset} (одновременных запросов: {args.max_in_flight}, "
+          f"размер пакета: {batch_size})...")
     start_time = time.time()
+    last_progress = start_time
+    first_row_at = None
 
-    for idx, row in df.iterrows():
-        text_no_spaces = row['text_no_spaces']
-
-        # Восстанавливаем пробелы через LLM
-        predicted_positions = model.restore_spaces(text_no_spaces)
-
-        # Сохраняем результат
-        results.append({
-            'id': row['id'],
-            'text_no_spaces': text_no_spaces,
-            'predicted_positions': str(predicted_positions)
-        })
-
-        processed += 1
-        if processed % 5 == 0:
-            elapsed = time.time() - start_time
-            avg_time = elapsed / processed
-            remaining = (len(df) - processed) * avg_time
-            print(f"Обработано: {processed}/{len(df)} ({processed/len(df)*100:.1f}%) "
-                  f"Среднее время: {avg_time:.2f}с, Осталось: {remaining/60:.1f} мин")
-
-        # Небольшая пауза чтобы не перегружать API
-        time.sleep(0.1)
+    try:
+        with writer:
+            for row_id, text_no_spaces, predicted_positions in restore_spaces_concurrently(
+                    dispatcher or model, rows, args.max_in_flight, batch_size):
+                # Сразу сохраняем результат на диск
+                if journal is not None:
+                    journal.append(row_id, predicted_positions)
+                else:
+                    writer.write(row_id, text_no_spaces, predicted_positions)
+
+                processed += 1
+                if first_row_at is None:
+                    first_row_at = time.perf_counter()
+                    print(f"Первая строка готова через {time.time() - start_time:.3f}с")
+                if time.time() - last_progress >= args.progress_interval:
+                    last_progress = time.time()
+                    if args.metrics_file:
+                        metrics.write_prometheus(args.metrics_file)
+                    # Среднее время считается по реальному времени, поэтому учитывает параллелизм
+                    elapsed = time.time() - start_time
+                    avg_time = elapsed / processed
+                    remaining = max(0, total - processed) * avg_time
+                    print(f"Обработано: {processed}/{total} ({processed/max(total, 1)*100:.1f}%) "
+                          f"Среднее время: {avg_time:.2f}с, Осталось: {remaining/60:.1f} мин")
+    except KeyboardInterrupt:
+        print(f"\nОбработка прервана после {processed} записей. "
+              f"Для продолжения запустите с флагом --resume")
+        return
+    print(reader.report())
 
-    # Сохранение результатов
-    result_df = pd.DataFrame(results)
-    result_df.to_csv('submission.csv', index=False)
-    print(f"Результаты сохранены в submission.csv")
+    if journal is not None:
+        # Итоговые файлы собираются из журнала за один проход по датасету
+        writer = build_submission(DatasetReader(args.dataset), journal.iter_records(), outputs)
+    print(writer.report())
+    if args.gold:
+        # NumPy нужен только для оценки, поэтому импортируем по требованию
+        from evaluation import evaluate_files, format_report
+        print(format_report(evaluate_files(args.dataset, args.gold, args.output)))
 
     print(f"Обработка завершена за {(time.time() - start_time)/60:.1f} минут")
+    if first_row_at is not None:
+        print(f"От запуска до первой готовой строки: {first_row_at - startup_time:.2f}с")
+    print_token_stats(model.token_stats)
+    summary = metrics.summary()
+    if summary.get('requests'):
+        print(f"Запросов к бэкенду: {summary['requests']:g}, ошибок: {summary.get('errors', 0):g}, "
+              f"средняя задержка HTTP: {summary.get('http_latency_avg', 0):.3f}с, "
+              f"среднее ожидание в очереди: {summary.get('queue_wait_avg', 0):.3f}с")
+    if args.metrics_file:
+        metrics.write_prometheus(args.metrics_file)
+        print(f"Метрики сохранены в {args.metrics_file}")
+    metrics.close()
+    if isinstance(backend, EndpointPool):
+        backend.close()
+        for endpoint in backend.stats():
+            print(f"Сервер {endpoint['url']}: запросов {endpoint['requests']}, "
+                  f"ошибок {endpoint['failures']}, {'доступен' if endpoint['healthy'] else 'недоступен'}")
+    if segmenter is not None:
+        print(f"Словарный сегментатор: {model.routing_stats['segmenter']} текстов, "
+              f"LLM: {model.routing_stats['llm']} текстов")
+    if dispatcher is not None and dispatcher.stats['texts']:
+        print(f"Объединение запросов: {dispatcher.stats['texts']} текстов, "
+              f"в модель {dispatcher.stats['model_texts']}, "
+              f"доля дубликатов {dispatcher.dedup_ratio:.1%}")
+    if args.class_split and model.routing_stats['chars']:
+        print(f"Стыки классов символов: {model.routing_stats['class_positions']} позиций без LLM, "
+              f"в LLM отправлено {model.routing_stats['llm_chars'] / model.routing_stats['chars']:.1%} "
+              f"символов")
+    if cache is not None:
+        stats = cache.stats()
+        print(f"Кэш: попаданий {stats['hits']}, промахов {stats['misses']}, "
+              f"доля попаданий {stats['hit_rate']*100:.1f}%")
+        cache.close()
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main(startup_time=STARTUP_TIME)
\ No newline at end of file
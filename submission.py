@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+"""
+Сборка и проверка итогового файла с результатами за один потоковый проход:
+недостающие id заполняются пустыми списками, каждая строка проверяется
+(позиции - целые, по возрастанию, без повторов, 0 < pos < len(text)),
+а все нужные форматы файла пишутся одновременно
+"""
+import argparse
+import ast
+import csv
+import json
+import os
+from collections import Counter
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from dataset_io import DatasetReader, SubmissionWriter
+
+# Форматы файла: (колонка с текстом, кавычки вокруг списка позиций)
+SUBMISSION_FORMATS = {
+    'full': (True, 'minimal'),       # id,text_no_spaces,predicted_positions
+    'minimal': (False, 'minimal'),   # 0,"[4, 12]" и 1,[]
+    'quoted': (False, 'all'),        # 0,"[4, 12]" и 1,"[]"
+    'unquoted': (False, 'none'),     # 0,[4, 12]
+}
+
+# Колонки, в которых может лежать список позиций (предсказания или эталон)
+POSITION_COLUMNS = ('predicted_positions', 'positions', 'true_positions', 'gold_positions')
+
+# Выходные файлы, которые раньше создавал fix_submission2.py
+LEGACY_OUTPUTS = [
+    ('submission_fixed_final.csv', 'minimal'),
+    ('submission_fixed_no_quotes.csv', 'unquoted'),
+    ('submission_fixed_with_quotes.csv', 'quoted'),
+]
+
+
+def parse_output(value: str) -> Tuple[str, str]:
+    """Разбирает аргумент вида path[:format]"""
+    path, _, fmt = value.rpartition(':')
+    if not path or fmt not in SUBMISSION_FORMATS:
+        return value, 'minimal'
+    return path, fmt
+
+
+def normalize_positions(text: str, positions) -> Tuple[List[int], List[str]]:
+    """
+    Приводит позиции к допустимому виду и возвращает найденные проблемы:
+    not_list, not_int, out_of_range, duplicates, unsorted
+    """
+    if not isinstance(positions, (list, tuple)):
+        return [], ['not_list']
+    problems = []
+    values = []
+    for pos in positions:
+        if isinstance(pos, bool) or not isinstance(pos, int):
+            if 'not_int' not in problems:
+                problems.append('not_int')
+            continue
+        if not 0 < pos < len(text):
+            if 'out_of_range' not in problems:
+                problems.append('out_of_range')
+            continue
+        values.append(pos)
+    unique = sorted(set(values))
+    if len(unique) != len(values):
+        problems.append('duplicates')
+    elif unique != values:
+        problems.append('unsorted')
+    return unique, problems
+
+
+def parse_positions(value: str):
+    """Разбирает строку со списком позиций; None - разобрать не удалось"""
+    value = (value or '').strip().strip('"')
+    if not value:
+        return None
+    try:
+        return json.loads(value)
+    except ValueError:
+        try:
+            return ast.literal_eval(value)
+        except (ValueError, SyntaxError):
+            return None
+
+
+def read_journal(path: str) -> Iterator[Tuple[int, object]]:
+    """Читает журнал результатов (JSON Lines); оборванные и битые строки пропускаются"""
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+                yield int(record['id']), record['predicted_positions']
+            except (ValueError, KeyError, TypeError):
+                continue
+
+
+def read_predictions(path: str) -> Iterator[Tuple[int, object]]:
+    """
+    Читает предсказания из CSV любого формата (в том числе без кавычек,
+    где запятые списка разбивают строку на несколько колонок) или из журнала .jsonl
+    """
+    if path.endswith('.jsonl'):
+        yield from read_journal(path)
+        return
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        reader = csv.reader(f)
+        header = next(reader, None) or []
+        column = next((header.index(name) for name in POSITION_COLUMNS if name in header),
+                      len(header) - 1)
+        for row in reader:
+            if len(row) <= column:
+                continue
+            try:
+                row_id = int(row[0])
+            except ValueError:
+                continue
+            yield row_id, parse_positions(','.join(row[column:]))
+
+
+def merge_predictions(rows: Iterable[Tuple[int, str]],
+                      predictions: Iterable[Tuple[int, object]]
+                      ) -> Iterator[Tuple[int, str, object]]:
+    """
+    Сопоставляет строки датасета (id по возрастанию) с предсказаниями. Предсказания
+    считаются подпоследовательностью датасета и читаются параллельно с ним: строка, до
+    id которой очередь предсказаний ещё не дошла, получает None. Только если встретилось
+    предсказание для уже пройденного id (порядок нарушен), оставшиеся предсказания
+    загружаются в словарь; строки, уже отданные к этому моменту, не пересматриваются
+    """
+    predictions = iter(predictions)
+    pending = next(predictions, None)
+    fallback = None
+    for row_id, text in rows:
+        positions = None
+        if fallback is None and pending is not None:
+            if pending[0] == row_id:
+                positions = pending[1]
+                pending = next(predictions, None)
+            elif pending[0] < row_id:
+                fallback = dict([pending])
+                fallback.update(predictions)
+                pending = None
+        if fallback is not None:
+            positions = fallback.get(row_id)
+        yield row_id, text, positions
+
+
+class SubmissionBuilder:
+    """
+    Пишет проверенные результаты сразу во все запрошенные файлы. Файлы создаются
+    рядом с временным именем и заменяют старые только при close(), поэтому
+    можно перезаписывать тот же файл, из которого читаются предсказания.
+    Если блок with прервался исключением, временные файлы удаляются, а старые остаются
+    """
+
+    def __init__(self, outputs: List[Tuple[str, str]]):
+        self.outputs = outputs
+        self.rows = 0
+        self.missing = 0
+        self.problems = Counter()
+        self.examples = []
+        self._previous_id = None
+        self._writers = []
+        for path, fmt in outputs:
+            include_text, quoting = SUBMISSION_FORMATS[fmt]
+            self._writers.append(SubmissionWriter(f"{path}.tmp", include_text, quoting))
+
+    def write(self, row_id: int, text: str, positions):
+        """Проверяет и записывает одну строку; positions=None - результата нет"""
+        if positions is None:
+            self.missing += 1
+            positions = []
+        positions, problems = normalize_positions(text, positions)
+        # Строки идут в порядке датасета, поэтому повтор id - это повтор предыдущего
+        if row_id == self._previous_id:
+            problems.append('duplicate_id')
+        self._previous_id = row_id
+        for problem in problems:
+            self.problems[problem] += 1
+        if problems and len(self.examples) < 5:
+            self.examples.append((row_id, problems))
+        for writer in self._writers:
+            writer.write(row_id, text, positions)
+        self.rows += 1
+
+    def close(self):
+        for writer, (path, _) in zip(self._writers, self.outputs):
+            writer.close()
+            os.replace(writer.path, path)
+        self._writers = []
+
+    def __enter__(self):
+        return self
+
+    def discard(self):
+        """Закрывает и удаляет временные файлы, не трогая уже существующие"""
+        for writer in self._writers:
+            writer.close()
+            os.remove(writer.path)
+        self._writers = []
+
+    def __exit__(self, *exc_info):
+        if exc_info[0] is None:
+            self.close()
+        else:
+            self.discard()
+
+    def report(self) -> str:
+        lines = [f"Записано {self.rows} строк в {', '.join(path for path, _ in self.outputs)}"]
+        if self.missing:
+            lines.append(f"Нет результата для {self.missing} записей, записаны пустые списки")
+        if self.problems:
+            lines.append("Исправлено: " + ', '.join(f"{name} - {count}"
+                                                   for name, count in self.problems.most_common()))
+            for row_id, problems in self.examples:
+                lines.append(f"  id {row_id}: {', '.join(problems)}")
+        else:
+            lines.append("Все строки прошли проверку")
+        return '\n'.join(lines)
+
+
+def build_submission(rows: Iterable[Tuple[int, str]], predictions: Iterable[Tuple[int, object]],
+                     outputs: List[Tuple[str, str]]) -> SubmissionBuilder:
+    """Собирает файлы результатов за один проход по датасету"""
+    with SubmissionBuilder(outputs) as builder:
+        for row_id, text, positions in merge_predictions(rows, predictions):
+            builder.write(row_id, text, positions)
+    return builder
+
+
+def main(argv: Optional[List[str]] = None, default_outputs: Optional[List[Tuple[str, str]]] = None):
+    parser = argparse.ArgumentParser(description="Сборка и проверка файла с результатами")
+    parser.add_argument('--dataset', default='dataset_1937770_3.txt')
+    parser.add_argument('--predictions', default='submission.csv',
+                        help="CSV с предсказаниями или журнал .jsonl")
+    parser.add_argument('--output', action='append', default=None,
+                        help="Выходной файл path[:format], format: " + ', '.join(SUBMISSION_FORMATS)
+                             + " (можно несколько раз)")
+    args = parser.parse_args(argv)
+
+    outputs = [parse_output(value) for value in args.output] if args.output \
+        else default_outputs or LEGACY_OUTPUTS
+    builder = build_submission(DatasetReader(args.dataset), read_predictions(args.predictions),
+                               outputs)
+    print(builder.report())
+
+
+if __name__ == "__main__":
+    main()
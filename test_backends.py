@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Проверки пула серверов EndpointPool и потокового режима на локальных серверах-заглушках
+"""
+import pytest
+
+from backends import BackendError, EndpointPool, OllamaBackend, create_backend
+from mock_server import MockInferenceServer, class_transition_positions
+from space_restoration_solution import SpaceRestoration, restore_spaces_concurrently
+
+TEXTS = ["куплюайфон17max", "ищудомвПодмосковье", "сдаюквартиру2комнаты", "iphone15pro"]
+
+
+@pytest.fixture
+def servers():
+    started = [MockInferenceServer(latency=0.002).start() for _ in range(3)]
+    yield started
+    for server in started:
+        server.stop()
+
+
+def stopped_url() -> str:
+    """Адрес, на котором уже никто не слушает"""
+    server = MockInferenceServer()
+    url = server.url
+    server.stop()
+    return url
+
+
+def make_pool(urls) -> EndpointPool:
+    pool = create_backend('ollama', ','.join(urls), timeout=2)
+    assert isinstance(pool, EndpointPool)
+    return pool
+
+
+def test_failover_when_server_stops_mid_run(servers):
+    pool = make_pool(server.url for server in servers)
+    model = SpaceRestoration(backend=pool)
+    rows = [(i, TEXTS[i % len(TEXTS)]) for i in range(60)]
+
+    first = list(restore_spaces_concurrently(model, rows[:30], 4, 1))
+    assert servers[1].requests > 0
+    servers[1].stop()
+    second = list(restore_spaces_concurrently(model, rows[30:], 4, 1))
+
+    results = first + second
+    assert [row_id for row_id, _, _ in results] == list(range(60))
+    for _, text, positions in results:
+        assert positions == class_transition_positions(text)
+    stats = pool.stats()
+    assert not stats[1]['healthy']
+    assert stats[1]['failures'] >= 1
+    assert stats[0]['healthy'] and stats[2]['healthy']
+
+
+def test_all_servers_down_raises():
+    pool = make_pool([stopped_url(), stopped_url()])
+    with pytest.raises(BackendError):
+        pool.generate_batch(["<input>\n<text>абв</text>\n</input>"], {})
+
+
+def test_least_busy_server_is_chosen(servers):
+    pool = make_pool(server.url for server in servers)
+    # Пока запросы не завершены, каждый следующий уходит на свободный сервер
+    assert [pool.acquire(set(), 1) for _ in range(3)] == [0, 1, 2]
+    pool.acquire(set(), 1)
+    pool.release(1, 1)
+    pool.release(2, 1)
+    assert pool.outstanding == [2, 0, 0]
+    assert pool.acquire(set(), 1) == 1
+    # Неисправный сервер не выбирается, даже если он свободен
+    pool.healthy[2] = False
+    pool.release(1, 1)
+    assert pool.acquire(set(), 4) == 1
+
+
+def test_recovered_server_returns_to_pool(servers):
+    pool = make_pool(server.url for server in servers)
+    port = int(servers[2].url.rsplit(':', 1)[1])
+    servers[2].stop()
+    assert pool.check_health() == [True, True, False]
+
+    servers[2] = MockInferenceServer(port=port).start()
+    assert pool.check_health() == [True, True, True]
+    # Первые два сервера заняты - запрос уходит на вернувшийся
+    pool.acquire(set(), 1)
+    pool.acquire(set(), 1)
+    pool.generate_batch(["<input>\n<text>абв</text>\n</input>"], {})
+    assert servers[2].requests == 1
+
+
+def test_warm_up_skips_failed_server(servers):
+    pool = make_pool([servers[0].url, stopped_url(), servers[2].url])
+    generation = pool.warm_up("<input>\n<text></text>\n</input>", {'num_predict': 200})
+    assert generation is not None
+    assert pool.healthy == [True, False, True]
+    assert servers[0].requests == 1 and servers[2].requests == 1
+
+
+def test_warm_up_fails_when_no_server_answers():
+    pool = make_pool([stopped_url(), stopped_url()])
+    with pytest.raises(BackendError):
+        pool.warm_up("<input>\n<text></text>\n</input>", {})
+    assert pool.healthy == [False, False]
+
+
+def test_stream_early_stop_is_quiet(capfd):
+    with MockInferenceServer(token_latency=0.002, chatter_tokens=50) as server:
+        backend = OllamaBackend(server.url, timeout=2, stream=True)
+        generation = backend.generate("<input>\n<text>iphone15pro</text>\n</input>", {'num_predict': 200})
+        assert generation.stats['tokens_saved'] > 0
+        # Разрыв соединения клиентом, где бы он ни случился, трассировку не печатает
+        try:
+            raise ConnectionResetError(104, 'Connection reset by peer')
+        except ConnectionResetError:
+            server._httpd.handle_error(None, ('127.0.0.1', 0))
+    assert 'Traceback' not in capfd.readouterr().err
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""
+Проверки CoalescingDispatcher на локальном сервере-заглушке
+"""
+from backends import OllamaBackend
+from mock_server import MockInferenceServer, class_transition_positions
+from request_coalescing import CoalescingDispatcher, map_positions
+from space_restoration_solution import SpaceRestoration
+
+TEXT = "iphone15pro"
+
+
+def test_failed_answer_is_not_memoized():
+    server = MockInferenceServer()
+    port = int(server.url.rsplit(':', 1)[1])
+    server.stop()
+    model = SpaceRestoration(backend=OllamaBackend(server.url, timeout=2))
+    dispatcher = CoalescingDispatcher(model)
+
+    # Сервер не работает: ответа нет, и запоминать нечего
+    assert dispatcher.restore_spaces_batch([TEXT]) == [[]]
+    assert dispatcher.stats['not_memoized'] == 1
+
+    with MockInferenceServer(port=port) as server:
+        assert dispatcher.restore_spaces_batch([TEXT]) == [class_transition_positions(TEXT)]
+        assert server.requests == 1
+        # Полный ответ запомнен: повторный текст до сервера не доходит
+        assert dispatcher.restore_spaces_batch([TEXT]) == [class_transition_positions(TEXT)]
+        assert server.requests == 1
+        assert dispatcher.stats['memo_hits'] == 1
+
+
+def test_template_positions_are_shifted_to_each_text():
+    class Model:
+        def __init__(self):
+            self.calls = []
+
+        def restore_spaces_batch(self, texts):
+            self.calls.append(texts)
+            return [class_transition_positions(text) for text in texts]
+
+    model = Model()
+    dispatcher = CoalescingDispatcher(model, canonicalize=True)
+    texts = ["куплюайфон7про", "КуплюАйфон15про", "куплюайфон128про"]
+    assert dispatcher.restore_spaces_batch(texts) == [class_transition_positions(text)
+                                                       for text in texts]
+    assert model.calls == [["куплюайфон7про"]]
+    assert dispatcher.stats['duplicates'] == 2
+    # Пробел внутри числа в другом тексте поставить некуда
+    assert map_positions("ab12cd", [2, 3, 4], "ab5cd") == [2, 3]
@@ -4,6 +4,7 @@
 """
 import requests
 import os
+from backends import OpenAICompatibleBackend
 from space_restoration_solution import SpaceRestoration
 
 
@@ -28,7 +29,7 @@ def test_llm_examples():
     """Тестирует LLM на примерах из ТЗ"""
 
     vllm_url = os.getenv('VLLM_API_URL', 'http://localhost:8000')
-    model = SpaceRestoration(vllm_url)
+    model = SpaceRestoration(vllm_url, backend=OpenAICompatibleBackend(vllm_url))
 
     test_cases = [
         "куплюайфон14про",
@@ -58,6 +59,11 @@ def test_llm_examples():
 
         print("-" * 30)
 
+    # Все примеры одним запросом: vLLM обрабатывает их в одном батче
+    print("\nПакетная обработка:")
+    for text, positions in zip(test_cases, model.restore_spaces_batch(test_cases)):
+        print(f"{text}: {positions}")
+
 
 if __name__ == "__main__":
     print("Проверка LLM-only решения")
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Проверки сборки файла результатов submission.py
+"""
+import pytest
+
+import submission
+from submission import merge_predictions
+
+ROWS = [(row_id, f"текст{row_id}") for row_id in range(10)]
+
+
+def test_missing_ids_do_not_load_predictions():
+    read = []
+
+    def predictions():
+        for row_id in (0, 3, 4, 8):
+            read.append(row_id)
+            yield row_id, [1]
+
+    merged = merge_predictions(ROWS, predictions())
+    # Пропуск id 1 и 2 не заставляет читать предсказания вперёд
+    assert [next(merged) for _ in range(3)] == [(0, "текст0", [1]), (1, "текст1", None),
+                                                (2, "текст2", None)]
+    assert read == [0, 3]
+    assert [positions for _, _, positions in merged] == [[1], [1], None, None, None, [1], None]
+
+
+def test_out_of_order_predictions_fall_back_to_dict():
+    merged = list(merge_predictions(ROWS[:5], [(0, [1]), (3, [2]), (2, [3]), (4, [4])]))
+    # id 2 пришёл после 3: строка 2 уже отдана, остальные сопоставлены по словарю
+    assert [positions for _, _, positions in merged] == [[1], None, None, [2], [4]]
+
+
+@pytest.fixture
+def dataset(tmp_path):
+    path = tmp_path / 'dataset.txt'
+    path.write_text("id,text_no_spaces\n" + ''.join(f"{row_id},{text}\n" for row_id, text in ROWS),
+                    encoding='utf-8')
+    return path
+
+
+def test_failed_rebuild_keeps_source_file(tmp_path, dataset):
+    source = tmp_path / 'submission.csv'
+    lines = [f'{row_id},"[1]"\n'.encode('utf-8') for row_id, _ in ROWS]
+    lines[5] = b'5,"[\xff]"\n'
+    data = b"id,predicted_positions\n" + b''.join(lines)
+    source.write_bytes(data)
+
+    with pytest.raises(UnicodeDecodeError):
+        submission.main(['--dataset', str(dataset), '--predictions', str(source),
+                         '--output', f"{source}:minimal"])
+    assert source.read_bytes() == data
+    assert not (tmp_path / 'submission.csv.tmp').exists()
+
+
+def test_rebuild_in_place(tmp_path, dataset):
+    source = tmp_path / 'submission.csv'
+    source.write_text("id,text_no_spaces,predicted_positions\n0,текст0,\"[3, 1]\"\n2,текст2,[]\n",
+                      encoding='utf-8')
+    submission.main(['--dataset', str(dataset), '--predictions', str(source),
+                     '--output', f"{source}:minimal"])
+    lines = source.read_text(encoding='utf-8').splitlines()
+    assert lines[:4] == ['id,predicted_positions', '0,"[1, 3]"', '1,[]', '2,[]']
+    assert len(lines) == len(ROWS) + 1
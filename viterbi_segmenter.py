@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+"""
+Словарный сегментатор на основе алгоритма Витерби (униграммы и биграммы слов).
+Работает на CPU без обращения к LLM и возвращает позиции пробелов
+в том же формате, что и SpaceRestoration.parse_positions_from_llm_response
+"""
+import argparse
+import math
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+# Классы символов: слово не может пересекать границу между ними
+CYRILLIC, LATIN, DIGIT, OTHER = 'cyrillic', 'latin', 'digit', 'other'
+
+# Частые латинские токены из объявлений, если их нет в словаре
+DEFAULT_LATIN_TOKENS = (
+    'iphone', 'ipad', 'macbook', 'airpods', 'apple', 'samsung', 'galaxy', 'xiaomi', 'redmi',
+    'huawei', 'honor', 'philips', 'sony', 'lg', 'bosch', 'nike', 'adidas', 'max', 'pro',
+    'mini', 'plus', 'ultra', 'lite', 'air', 'gb', 'tb', 'wifi', 'usb', 'hd', 'smart', 'tv',
+)
+
+
+def char_class(ch: str) -> str:
+    """Определяет класс символа"""
+    if ch.isdigit():
+        return DIGIT
+    if 'а' <= ch.lower() <= 'я' or ch in 'ёЁ':
+        return CYRILLIC
+    if 'a' <= ch.lower() <= 'z':
+        return LATIN
+    return OTHER
+
+
+class WordTrie:
+    """
+    Словарь слов с весом (логарифмом вероятности) в виде отсортированного массива:
+    слова с общим префиксом идут подряд, поэтому поиск по префиксу - двоичный поиск.
+    В отличие от дерева из словарей (по dict на узел, около 1 КБ на слово) занимает
+    около 100 байт на слово: строка слова, указатель на неё и 8 байт веса в array('d'),
+    то есть порядка 100 МБ на словарь из миллиона слов
+    """
+
+    def __init__(self, values: Dict[str, float]):
+        self.words = sorted(values)
+        self.values = array('d', (values[word] for word in self.words))
+
+    def get(self, word: str) -> Optional[float]:
+        k = bisect_left(self.words, word)
+        if k < len(self.words) and self.words[k] == word:
+            return self.values[k]
+        return None
+
+    def prefixes(self, text: str, start: int, end: int) -> Iterator[Tuple[int, float]]:
+        """Перебирает слова словаря, начинающиеся в text[start] и не выходящие за end"""
+        words = self.words
+        low = 0
+        for j in range(start + 1, end + 1):
+            prefix = text[start:j]
+            # Слова, начинающиеся с более длинного префикса, не левее найденных для короткого
+            low = bisect_left(words, prefix, low)
+            if low == len(words) or not words[low].startswith(prefix):
+                return
+            if words[low] == prefix:
+                yield j, self.values[low]
+
+    def __len__(self) -> int:
+        return len(self.words)
+
+
+class ViterbiSegmenter:
+    """
+    Сегментатор по частотному словарю. Для каждого текста находит два самых вероятных
+    разбиения; уверенность - доля символов, покрытых словарными словами, умноженная
+    на вероятность лучшего разбиения относительно второго. Если второе разбиение почти
+    так же вероятно (текст неоднозначен), уверенность падает до 0.5 и ниже
+    """
+
+    def __init__(self, unigrams: Dict[str, int], bigrams: Optional[Dict[Tuple[str, str], int]] = None,
+                 max_unknown_length: int = 20, backoff: float = 0.4):
+        self.max_unknown_length = max_unknown_length
+        self.total = max(1, sum(unigrams.values()))
+        self.log_total = math.log(self.total)
+        self.log_backoff = math.log(backoff)
+
+        values = {}
+        for word, count in unigrams.items():
+            if count > 0:
+                values[word.lower()] = math.log(count) - self.log_total
+        for word in DEFAULT_LATIN_TOKENS:
+            values.setdefault(word, -self.log_total)
+        self.trie = WordTrie(values)
+
+        # Биграммы храним как логарифм условной вероятности log P(w2 | w1)
+        self.bigrams = {}
+        lowered = Counter({word.lower(): count for word, count in unigrams.items()})
+        for (first, second), count in (bigrams or {}).items():
+            first, second = first.lower(), second.lower()
+            if count > 0 and lowered.get(first):
+                self.bigrams[(first, second)] = math.log(count) - math.log(lowered[first])
+
+    @classmethod
+    def from_frequency_file(cls, path: str, **kwargs) -> 'ViterbiSegmenter':
+        """
+        Загружает словарь из текстового файла: строки "слово частота"
+        для униграмм и "слово1 слово2 частота" для биграмм
+        """
+        unigrams, bigrams = {}, {}
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) == 2:
+                    unigrams[parts[0]] = unigrams.get(parts[0], 0) + int(parts[1])
+                elif len(parts) == 3:
+                    bigrams[(parts[0], parts[1])] = int(parts[2])
+        return cls(unigrams, bigrams, **kwargs)
+
+    @classmethod
+    def from_corpus(cls, lines: Iterable[str], **kwargs) -> 'ViterbiSegmenter':
+        """Строит словарь по текстам с пробелами"""
+        unigrams, bigrams = count_ngrams(lines)
+        return cls(unigrams, bigrams, **kwargs)
+
+    def word_score(self, word: str, previous: Optional[str], unigram: Optional[float] = None) -> float:
+        """
+        Логарифм вероятности словарного слова с учётом предыдущего слова;
+        unigram - вес слова, если он уже найден в словаре
+        """
+        if unigram is None:
+            unigram = self.trie.get(word)
+        if previous is not None:
+            score = self.bigrams.get((previous, word))
+            if score is not None:
+                return score
+            if self.bigrams:
+                return self.log_backoff + unigram
+        return unigram
+
+    def unknown_score(self, length: int) -> float:
+        """Штраф за несловарный фрагмент: чем длиннее, тем менее вероятен"""
+        return math.log(10.0) - self.log_total - length * math.log(10.0)
+
+    def segment(self, text: str) -> Tuple[List[int], float]:
+        """Возвращает позиции пробелов и уверенность от 0 до 1"""
+        n = len(text)
+        if n == 0:
+            return [], 1.0
+
+        lowered = text.lower()
+        classes = [char_class(ch) for ch in text]
+        # Конец непрерывного фрагмента одного класса для каждой позиции
+        run_end = [n] * n
+        for i in range(n - 2, -1, -1):
+            run_end[i] = run_end[i + 1] if classes[i] == classes[i + 1] else i + 1
+
+        # Для каждой позиции - до двух лучших путей: (оценка, начало последнего фрагмента,
+        # номер пути в той позиции, фрагмент словарный, последнее слово)
+        beams = [[] for _ in range(n + 1)]
+        beams[0].append((0.0, 0, 0, False, None))
+
+        for i in range(n):
+            if not beams[i]:
+                continue
+            end = run_end[i]
+
+            # Числа и прочие символы не разрезаем
+            whole = classes[i] in (DIGIT, OTHER)
+            if not whole:
+                words = [(j, lowered[i:j], value) for j, value in self.trie.prefixes(lowered, i, end)]
+                # Фрагмент, совпадающий со словом, несловарным не считаем: иначе второй путь
+                # отличался бы от первого только оценкой, а не разбиением
+                known_ends = {j for j, _, _ in words}
+                unknown = [(j, self.unknown_score(j - i), False, None)
+                           for j in range(i + 1, min(end, i + self.max_unknown_length) + 1)
+                           if j not in known_ends]
+
+            for rank, (base, _, _, _, previous) in enumerate(beams[i]):
+                if whole:
+                    candidates = [(end, 0.0, True, None)]
+                else:
+                    candidates = [(j, self.word_score(word, previous, value), True, word)
+                                  for j, word, value in words]
+                    candidates += unknown
+                for j, score, is_known, word in candidates:
+                    beam = beams[j]
+                    score += base
+                    if not beam:
+                        beam.append((score, i, rank, is_known, word))
+                    elif score > beam[0][0]:
+                        beam[1:] = [beam[0]]
+                        beam[0] = (score, i, rank, is_known, word)
+                    elif len(beam) == 1 or score > beam[1][0]:
+                        beam[1:] = [(score, i, rank, is_known, word)]
+
+        positions = []
+        covered = 0
+        j, rank = n, 0
+        while j > 0:
+            _, i, previous_rank, is_known, _ = beams[j][rank]
+            if is_known:
+                covered += j - i
+            if i > 0:
+                positions.append(i)
+            j, rank = i, previous_rank
+
+        # Вероятность лучшего из двух разбиений: 1 / (1 + P(второе) / P(лучшее))
+        margin = 1.0
+        if len(beams[n]) > 1:
+            margin = 1.0 / (1.0 + math.exp(beams[n][1][0] - beams[n][0][0]))
+        return sorted(positions), covered / n * margin
+
+
+def count_ngrams(lines: Iterable[str]) -> Tuple[Counter, Counter]:
+    """Считает частоты слов и пар соседних слов"""
+    unigrams, bigrams = Counter(), Counter()
+    for line in lines:
+        words = line.lower().split()
+        unigrams.update(words)
+        bigrams.update(zip(words, words[1:]))
+    return unigrams, bigrams
+
+
+def insert_spaces(text: str, positions: List[int]) -> str:
+    """Вставляет пробелы перед указанными позициями"""
+    parts = []
+    previous = 0
+    for pos in sorted(set(positions)):
+        if 0 < pos < len(text):
+            parts.append(text[previous:pos])
+            previous = pos
+    parts.append(text[previous:])
+    return ' '.join(parts)
+
+
+def iter_segmented_texts(dataset_path: str, submission_path: str) -> Iterator[str]:
+    """Восстанавливает тексты с пробелами по датасету и файлу с позициями (например, ответам LLM)"""
+    # Импорт здесь: submission и dataset_io нужны только для сборки словаря
+    from dataset_io import DatasetReader
+    from submission import merge_predictions, normalize_positions, read_predictions
+
+    for _, text, positions in merge_predictions(DatasetReader(dataset_path),
+                                                read_predictions(submission_path)):
+        if positions is not None:
+            yield insert_spaces(text, normalize_positions(text, positions)[0])
+
+
+def save_frequency_file(path: str, unigrams: Counter, bigrams: Counter):
+    """Сохраняет словарь в формате from_frequency_file"""
+    with open(path, 'w', encoding='utf-8') as f:
+        for word, count in unigrams.most_common():
+            f.write(f"{word} {count}\n")
+        for (first, second), count in bigrams.most_common():
+            f.write(f"{first} {second} {count}\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Словарный сегментатор Витерби")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    build = subparsers.add_parser('build', help="Построить словарь по размеченным текстам")
+    build.add_argument('--corpus', help="Текстовый файл с пробелами, по строке на текст")
+    build.add_argument('--dataset', help="Датасет без пробелов (вместе с --submission)")
+    build.add_argument('--submission', help="Файл с позициями пробелов для датасета")
+    build.add_argument('--output', required=True, help="Куда сохранить словарь")
+
+    segment = subparsers.add_parser('segment', help="Разбить тексты на слова")
+    segment.add_argument('--dictionary', required=True, help="Файл словаря")
+    segment.add_argument('texts', nargs='+')
+
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        if args.corpus:
+            with open(args.corpus, 'r', encoding='utf-8') as f:
+                unigrams, bigrams = count_ngrams(f)
+        elif args.dataset and args.submission:
+            unigrams, bigrams = count_ngrams(iter_segmented_texts(args.dataset, args.submission))
+        else:
+            parser.error("нужен --corpus или пара --dataset и --submission")
+        save_frequency_file(args.output, unigrams, bigrams)
+        print(f"Словарь сохранён в {args.output}: {len(unigrams)} слов, {len(bigrams)} биграмм")
+    else:
+        segmenter = ViterbiSegmenter.from_frequency_file(args.dictionary)
+        for text in args.texts:
+            positions, confidence = segmenter.segment(text)
+            print(f"{insert_spaces(text, positions)}  {positions}  уверенность: {confidence:.2f}")
+
+
+if __name__ == "__main__":
+    main()